@@ -4,12 +4,22 @@
 """
 A simple demo of processing pipelines using coroutine, and broadcasting a data
 stream to multiple coroutines.
+
+When the broadcast targets are all "grep" stages, "multi_grep" does the same
+routing in a single pass over each line, no matter how many patterns there are.
+When the broadcast targets are CPU-heavy, "parallel_broadcast" runs them in
+worker processes instead.
 """
 
+import multiprocessing as mp
+import re
 import sys
-from typing import Coroutine, List
+from functools import partial
+from typing import Callable, Coroutine, Dict, List, Tuple
 
 from coroutine import coroutine
+from copipe import grep_batched, printer_batched, source_read_batched
+from coqueue import put_checked
 
 
 def source_read(filename: str, target: Coroutine) -> None:
@@ -33,6 +43,8 @@ def source_read(filename: str, target: Coroutine) -> None:
 def broadcast(targets: List[Coroutine]):
     """
     A coroutine that broadcasts the read lines to the given targets.
+    Since the received items are forwarded as they are, this also works on
+    batches of lines in a batched pipeline.
     :param targets: list[coroutine]
     :return: coroutine
     """
@@ -41,9 +53,9 @@ def broadcast(targets: List[Coroutine]):
             line = yield
             for target in targets:
                 target.send(line)
-    except GeneratorExit as e:
+    except GeneratorExit:
         for target in targets:
-            target.throw(e)
+            target.close()
 
 
 @coroutine
@@ -60,8 +72,8 @@ def grep(pattern: str, target: Coroutine):
             line = yield
             if pattern in line:
                 target.send(line)
-    except GeneratorExit as e:
-        target.throw(e)
+    except GeneratorExit:
+        target.close()
 
 
 @coroutine
@@ -78,14 +90,274 @@ def printer():
         pass
 
 
-def main(filename: str):
-    p = printer()
-    grep_filter1 = grep(pattern='python', target=p)
-    grep_filter2 = grep(pattern='swig', target=p)
-    grep_filter3 = grep(pattern='ply', target=p)
-    broadcaster = broadcast(targets=[grep_filter1, grep_filter2, grep_filter3])
-    source_read(filename=filename, target=broadcaster)
+def trie_regex(patterns: List[str]) -> str:
+    """
+    Builds a regex that matches any of the given patterns, by factoring out
+    their common prefixes like in a trie (prefix tree).
+    This way, the regex engine walks down the trie once at each position of a
+    line, instead of trying each pattern in turn like with a plain alternation.
+    Where a pattern is a prefix of longer ones, the longest one is preferred.
+    :param patterns: list[str]
+    :return: str
+    """
+    trie = {}
+    for pattern in patterns:
+        node = trie
+        for ch in pattern:
+            node = node.setdefault(ch, {})
+        node[''] = {}  # Marks the end of a pattern
+
+    def node_to_regex(node: dict) -> str:
+        branches = [
+            re.escape(ch) + node_to_regex(child)
+            for ch, child in node.items() if ch
+        ]
+        if not branches:
+            return ''
+        if len(branches) == 1:
+            body = branches[0]
+        else:
+            body = f"(?:{'|'.join(branches)})"
+        # The optional group is greedy, so the longer patterns come first
+        return f'(?:{body})?' if '' in node else body
+
+    return node_to_regex(trie)
+
+
+def compile_patterns(
+    patterns: List[str]
+) -> Tuple[re.Pattern, Dict[str, List[str]]]:
+    """
+    Compiles the given patterns into a single regex that finds, at every
+    position of a line, the longest pattern starting there.
+    Since a pattern found in a line implies that all the patterns contained in
+    it are in the line as well, the returned mapping from each pattern to the
+    patterns it contains completes the set of matched patterns.
+    :param patterns: list[str]
+    :return: tuple(re.Pattern, dict{str: list[str]})
+    """
+    # The lookahead makes the regex find overlapping occurrences as well
+    regex = re.compile(f'(?=({trie_regex(patterns)}))')
+    contained = {
+        pattern: [other for other in patterns if other in pattern]
+        for pattern in patterns
+    }
+    return regex, contained
+
+
+@coroutine
+def multi_grep(targets: Dict[str, Coroutine]):
+    """
+    A coroutine that searches for all the given patterns in a single pass, and
+    feeds each line to the target of every pattern found in it (in the order of
+    the given mapping, like broadcasting to one "grep" per pattern).
+    :param targets: dict{str: coroutine}
+    :return: coroutine
+    """
+    regex, contained = compile_patterns(list(targets))
+    order = {pattern: i for i, pattern in enumerate(targets)}
+    try:
+        while True:
+            line = yield
+            found = {
+                other
+                for longest in set(regex.findall(line))
+                for other in contained[longest]
+            }
+            for pattern in sorted(found, key=order.__getitem__):
+                targets[pattern].send(line)
+    except GeneratorExit:
+        for target in targets.values():
+            target.close()
+
+
+@coroutine
+def multi_grep_batched(targets: Dict[str, Coroutine]):
+    """
+    Batched version of multi_grep(), which feeds each target the list of the
+    lines in the received batch that contain its pattern.
+    :param targets: dict{str: coroutine}
+    :return: coroutine
+    """
+    regex, contained = compile_patterns(list(targets))
+    try:
+        while True:
+            lines = yield
+            matched = {pattern: [] for pattern in targets}
+            for line in lines:
+                found = {
+                    other
+                    for longest in set(regex.findall(line))
+                    for other in contained[longest]
+                }
+                for pattern in found:
+                    matched[pattern].append(line)
+            for pattern, target in targets.items():
+                if matched[pattern]:
+                    target.send(matched[pattern])
+    except GeneratorExit:
+        for target in targets.values():
+            target.close()
+
+
+def parallel_worker(q: mp.Queue, target_factories: List[Callable]) -> None:
+    """
+    Worker process function to build its group of target coroutines, and feed
+    every line of the batches received from the given queue to all of them.
+    :param q: Queue
+    :param target_factories: list[callable]
+    :return: None
+    """
+    targets = [factory() for factory in target_factories]
+    while True:
+        lines = q.get()
+        if lines is None:  # The broadcaster is closed
+            for target in targets:
+                target.close()
+            return
+        for line in lines:
+            for target in targets:
+                target.send(line)
+
+
+def put_to_worker(q: mp.Queue, worker: mp.Process, item) -> None:
+    """
+    Puts the given item into the given worker's queue, blocking while the queue
+    is full, but failing instead of hanging forever if the worker has died.
+    :param q: Queue
+    :param worker: Process
+    :param item: object
+    :return: None
+    """
+    def check() -> None:
+        if not worker.is_alive():
+            raise RuntimeError(
+                f'{worker.name} died with exit code {worker.exitcode}'
+            )
+
+    put_checked(q, item, check)
+
+
+@coroutine
+def parallel_broadcast(
+    target_factories: List[Callable], n_workers: int = mp.cpu_count(),
+    batch_size: int = 1024
+):
+    """
+    A coroutine that broadcasts the read lines to targets running in worker
+    processes.
+    Since coroutines cannot be sent to another process, each target is given
+    as a factory that builds it, and the targets are sharded across the
+    workers.
+    The lines are shipped to the workers in batches of the given size, and each
+    target lives in exactly one worker, so every target still receives the
+    lines in order. Closing this coroutine flushes the last batch, and waits for
+    all the workers to close their targets and exit.
+    Note that the factories must be picklable (e.g., module-level functions or
+    functools.partial of them) where processes are spawned instead of forked.
+    :param target_factories: list[callable]
+    :param n_workers: int
+    :param batch_size: int
+    :return: coroutine
+    """
+    n_workers = max(1, min(n_workers, len(target_factories)))
+    # A bounded queue per worker, so that a slow worker applies backpressure
+    # instead of piling up batches in memory
+    queues = [mp.Queue(maxsize=8) for _ in range(n_workers)]
+    workers = [
+        mp.Process(
+            target=parallel_worker,
+            args=(q, target_factories[i::n_workers]),
+            name=f'parallel_broadcast-worker-{i}'
+        )
+        for i, q in enumerate(queues)
+    ]
+    for worker in workers:
+        worker.start()
+    lines = []
+    try:
+        try:
+            while True:
+                line = yield
+                lines.append(line)
+                if len(lines) >= batch_size:
+                    for q, worker in zip(queues, workers):
+                        put_to_worker(q, worker, lines)
+                    lines = []
+        except GeneratorExit:
+            for q, worker in zip(queues, workers):
+                if lines:
+                    put_to_worker(q, worker, lines)
+                put_to_worker(q, worker, None)
+    except RuntimeError:
+        # A worker died: stop the other ones too, as the broadcast is
+        # incomplete anyway, so that they do not wait for more lines forever
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join()
+        raise
+    else:
+        for worker in workers:
+            worker.join()
+        failed = [worker.name for worker in workers if worker.exitcode != 0]
+        if failed:
+            raise RuntimeError(f"Workers failed: {', '.join(failed)}")
+
+
+def grep_to_printer(pattern: str) -> Coroutine:
+    """
+    Target factory for parallel_broadcast(), which builds a "grep" stage that
+    prints the filtered lines.
+    :param pattern: str
+    :return: coroutine
+    """
+    return grep(pattern=pattern, target=printer())
+
+
+def main(filename: str, mode: str = 'line'):
+    if mode == 'parallel':
+        # Note that in parallel mode, the lines from different patterns are
+        # printed by different processes, so they may interleave arbitrarily
+        broadcaster = parallel_broadcast(
+            target_factories=[
+                partial(grep_to_printer, pattern)
+                for pattern in ['python', 'swig', 'ply']
+            ]
+        )
+        source_read(filename=filename, target=broadcaster)
+    elif mode == 'multi':
+        p = printer()
+        router = multi_grep(targets={'python': p, 'swig': p, 'ply': p})
+        source_read(filename=filename, target=router)
+    elif mode == 'batched':
+        # Note that in batched mode, the lines within a batch are grouped by
+        # pattern when printed
+        p = printer_batched()
+        grep_filter1 = grep_batched(pattern='python', target=p)
+        grep_filter2 = grep_batched(pattern='swig', target=p)
+        grep_filter3 = grep_batched(pattern='ply', target=p)
+        broadcaster = broadcast(
+            targets=[grep_filter1, grep_filter2, grep_filter3]
+        )
+        source_read_batched(filename=filename, target=broadcaster)
+    else:
+        p = printer()
+        grep_filter1 = grep(pattern='python', target=p)
+        grep_filter2 = grep(pattern='swig', target=p)
+        grep_filter3 = grep(pattern='ply', target=p)
+        broadcaster = broadcast(
+            targets=[grep_filter1, grep_filter2, grep_filter3]
+        )
+        source_read(filename=filename, target=broadcaster)
 
 
 if __name__ == '__main__':
-    main(sys.argv[1])
+    if '--parallel' in sys.argv[2:]:
+        main(sys.argv[1], mode='parallel')
+    elif '--multi' in sys.argv[2:]:
+        main(sys.argv[1], mode='multi')
+    elif '--batched' in sys.argv[2:]:
+        main(sys.argv[1], mode='batched')
+    else:
+        main(sys.argv[1])
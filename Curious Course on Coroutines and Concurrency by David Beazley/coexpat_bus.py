@@ -4,12 +4,18 @@
 """
 An example showing how to do the same XML parsing as in cosax_bus.py but using
 Expat, which is in lower-level than SAX.
+
+Going even lower, expat_parse_buses() fuses the parsing and buses_to_dicts()
+together: the Expat handlers collect the bus information themselves, and only
+send one object per bus into the processing stages.
 """
 
 import xml.parsers.expat
 from typing import Coroutine
 
-from cosax_bus import bus_info_printer, buses_to_dicts, filter_on_field
+from cosax_bus import (
+    BusRecord, build_pipeline, bus_info_printer, buses_to_dicts, field_equals
+)
 
 
 def expat_parse(filename: str, target: Coroutine) -> None:
@@ -26,14 +32,80 @@ def expat_parse(filename: str, target: Coroutine) -> None:
         parser.ParseFile(f)
 
 
+def bus_parser(target: Coroutine, as_records: bool = False):
+    """
+    Creates an Expat parser, whose handlers collect the bus information as a
+    dictionary (or a compact BusRecord in record mode) directly, and feed each
+    bus to the given target coroutine.
+    The character data outside the bus fields (mostly whitespace) is dropped
+    right away.
+    :param target: coroutine
+    :param as_records: bool
+    :return: xmlparser
+    """
+    bus = None  # The bus being collected, if any
+    field = None  # The field being collected, if any
+    fragments = []
+
+    def start_element(name, attrs):
+        nonlocal bus, field
+        if bus is not None:
+            field = name
+            fragments.clear()
+        elif name == 'bus':
+            bus = BusRecord() if as_records else {}
+
+    def character_data(content):
+        if field is not None:
+            fragments.append(content)
+
+    def end_element(name):
+        nonlocal bus, field
+        if bus is None:
+            return
+        if name != 'bus':
+            bus[name] = ''.join(fragments)
+            field = None
+        else:
+            target.send(bus)
+            bus = None
+
+    parser = xml.parsers.expat.ParserCreate()
+    parser.buffer_text = True
+    parser.buffer_size = 65536
+    parser.StartElementHandler = start_element
+    parser.CharacterDataHandler = character_data
+    parser.EndElementHandler = end_element
+    return parser
+
+
+def expat_parse_buses(
+    filename: str, target: Coroutine, as_records: bool = False
+) -> None:
+    """
+    Parses the given file with Expat, collects the bus information as a
+    dictionary (or a compact BusRecord in record mode) directly in the Expat
+    handlers, and feeds each bus to the given target coroutine.
+    This is equivalent to expat_parse() into buses_to_dicts(), but without
+    making and sending an event tuple per callback.
+    :param filename: str
+    :param target: coroutine
+    :param as_records: bool
+    :return: None
+    """
+    with open(filename, 'rb') as f:
+        bus_parser(target=target, as_records=as_records).ParseFile(f)
+
+
 def main():
     # Push the lower-level initial data source into the same processing stages
     # without rewriting
-    direction_filter = filter_on_field(
-        field='direction', val='North Bound', target=bus_info_printer()
-    )
-    route_filter = filter_on_field(
-        field='route', val='22', target=direction_filter
+    route_filter = build_pipeline(
+        stages=[
+            field_equals(field='route', val='22'),
+            field_equals(field='direction', val='North Bound')
+        ],
+        sink=bus_info_printer()
     )
     expat_parse(
         filename='allroutes.xml', target=buses_to_dicts(target=route_filter)
@@ -0,0 +1,148 @@
+#!usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+An example showing how to parse an allroutes-style feed in parallel, and push
+the parsed buses into the same processing stages as in cosax_bus.py.
+
+The feed is split into shards at "<bus>" element boundaries, which are found by
+a plain byte search over the memory-mapped file, and the shards are parsed with
+Expat in a pool of worker processes.
+Note that this assumes that "<bus>" never appears in the text of the feed
+(e.g., within a CDATA section), which holds for these feeds.
+"""
+
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Coroutine, List, Tuple
+
+from coexpat_bus import bus_parser
+from coroutine import coroutine
+from cosax_bus import build_pipeline, bus_info_printer, field_equals
+
+BUS_START = b'<bus>'
+BUS_END = b'</bus>'
+
+
+def find_shards(filename: str, n_shards: int) -> List[Tuple[int, int]]:
+    """
+    Splits the "<bus>" elements in the given file into about the given number
+    of shards of similar sizes, and returns the (start, end) byte offsets of
+    each shard.
+    :param filename: str
+    :param n_shards: int
+    :return: list[tuple(int, int)]
+    """
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:  # An empty file cannot be mapped
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            first = mm.find(BUS_START)
+            last = mm.rfind(BUS_END)
+            if first == -1 or last == -1:
+                return []
+            end = last + len(BUS_END)
+            shard_size = max(1, (end - first) // n_shards)
+            shards = []
+            start = first
+            while start < end:
+                # Cut at the first bus starting after the approximate boundary
+                cut = mm.find(BUS_START, start + shard_size, end)
+                if cut == -1:
+                    cut = end
+                shards.append((start, cut))
+                start = cut
+            return shards
+
+
+def parse_shard(
+    filename: str, start: int, end: int, as_records: bool = False
+) -> list:
+    """
+    Worker function to parse the buses between the given byte offsets of the
+    given file.
+    :param filename: str
+    :param start: int
+    :param end: int
+    :param as_records: bool
+    :return: list
+    """
+    buses = []
+
+    @coroutine
+    def collector():
+        while True:
+            buses.append((yield))
+
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    # Wrap the shard in a root element, so that it is a document on its own
+    parser = bus_parser(target=collector(), as_records=as_records)
+    parser.Parse(b'<buses>', False)
+    parser.Parse(data, False)
+    parser.Parse(b'</buses>', True)
+    return buses
+
+
+def parallel_parse(
+    filename: str, target: Coroutine, n_workers: int = os.cpu_count(),
+    ordered: bool = True, as_records: bool = False
+) -> None:
+    """
+    Parses the given file in shards in a pool of worker processes, and feeds
+    the parsed buses to the given target coroutine.
+    If ordered, the buses are fed in document order; otherwise, the buses of
+    each shard are fed as soon as the shard is parsed.
+    :param filename: str
+    :param target: coroutine
+    :param n_workers: int
+    :param ordered: bool
+    :param as_records: bool
+    :return: None
+    """
+    # More shards than workers, so that the workers stay busy until the end
+    shards = find_shards(filename, n_shards=n_workers * 4)
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = [
+            executor.submit(parse_shard, filename, start, end, as_records)
+            for start, end in shards
+        ]
+        for future in futures if ordered else as_completed(futures):
+            for bus in future.result():
+                target.send(bus)
+
+
+def main():
+    route_filter = build_pipeline(
+        stages=[
+            field_equals(field='route', val='22'),
+            field_equals(field='direction', val='North Bound')
+        ],
+        sink=bus_info_printer()
+    )
+    parallel_parse(filename='allroutes.xml', target=route_filter)
+
+
+if __name__ == '__main__':
+    main()
+
+
+# Output:
+# 22, 1485, North Bound, 41.880481123924255, -87.62948191165924
+# 22, 1629, North Bound, 42.01851969751819, -87.6730209876751
+# 22, 1489, North Bound, 41.962393500588156, -87.66610128229314
+# 22, 1533, North Bound, 41.92381583870231, -87.6395345910803
+# 22, 1779, North Bound, 41.989253234863284, -87.66976165771484
+# 22, 1595, North Bound, 41.892801920572914, -87.62985568576389
+# 22, 1567, North Bound, 41.91437446296989, -87.63357444862267
+# 22, 1795, North Bound, 41.98753767747145, -87.66956552358774
+# 22, 1543, North Bound, 41.92852973937988, -87.64240264892578
+# 22, 1315, North Bound, 41.96697834559849, -87.66706085205078
+# 22, 6069, North Bound, 41.98728592755043, -87.66953517966074
+# 22, 1891, North Bound, 41.92987823486328, -87.64342498779297
+# 22, 1569, North Bound, 42.003393713033425, -87.6723536365437
+# 22, 1617, North Bound, 41.90174682617187, -87.63128570556641
+# 22, 1821, North Bound, 41.976410124037, -87.66838073730469
+# 22, 1499, North Bound, 41.96970504369491, -87.66764088166066
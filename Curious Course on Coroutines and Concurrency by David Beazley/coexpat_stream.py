@@ -0,0 +1,152 @@
+#!usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+An example showing how to feed an unbounded stream of XML documents into the
+same processing stages as in cosax_bus.py, chunk by chunk.
+
+The stream is a sequence of concatenated "<buses>" documents, like a live feed
+arriving over a socket, and it is parsed incrementally with Expat, so only the
+current chunk and the current bus are held in memory.
+"""
+
+import sys
+import xml.parsers.expat
+from typing import Coroutine
+
+from coroutine import coroutine
+from cosax_bus import (
+    build_pipeline, bus_info_printer, buses_to_dicts, field_equals
+)
+
+
+class DocumentEnd(Exception):
+    """
+    Raised from the Expat handlers to stop parsing at the end of a document.
+    """
+    pass
+
+
+@coroutine
+def expat_feed(target: Coroutine):
+    """
+    A coroutine that receives arbitrary chunks of bytes of a stream of
+    concatenated XML documents, parses them incrementally with Expat, and
+    feeds the resulting events to the given target coroutine, like
+    expat_parse() in coexpat_bus.py.
+    Each document gets a new parser, and the rest of the chunk after the end of
+    a document is fed to the parser of the next document.
+    :param target: coroutine
+    :return: coroutine
+    """
+    parser = None
+    depth = 0
+    fed = 0  # Number of bytes fed to the current parser before this chunk
+    end_tag_index = 0  # Where the end tag of the root element starts
+
+    def start_element(name, attrs):
+        nonlocal depth
+        depth += 1
+        target.send(('start', (name, attrs)))
+
+    def character_data(content):
+        target.send(('content', content))
+
+    def end_element(name):
+        nonlocal depth, end_tag_index
+        depth -= 1
+        target.send(('end', name))
+        if depth == 0:  # End of the root element, i.e., of the document
+            end_tag_index = parser.CurrentByteIndex
+            raise DocumentEnd
+
+    def new_parser():
+        p = xml.parsers.expat.ParserCreate()
+        p.buffer_text = True
+        p.buffer_size = 65536
+        p.StartElementHandler = start_element
+        p.CharacterDataHandler = character_data
+        p.EndElementHandler = end_element
+        return p
+
+    try:
+        while True:
+            chunk = yield
+            while chunk:
+                if parser is None:
+                    # Between documents: the whitespace is skipped, as an XML
+                    # declaration is only allowed at the very start
+                    chunk = chunk.lstrip()
+                    if not chunk:
+                        break
+                    parser = new_parser()
+                    fed = 0
+                try:
+                    parser.Parse(chunk, False)
+                    fed += len(chunk)
+                    chunk = b''
+                except DocumentEnd:
+                    # The end tag of the root element ends within this chunk
+                    end_tag_start = max(0, end_tag_index - fed)
+                    end_tag_end = chunk.index(b'>', end_tag_start) + 1
+                    chunk = chunk[end_tag_end:]
+                    parser = None
+    except GeneratorExit:
+        if parser is not None:
+            # Raises ExpatError if the stream ends in the middle of a document
+            parser.Parse(b'', True)
+        target.close()
+
+
+def source_stream(f, target: Coroutine, chunk_size: int = 65536) -> None:
+    """
+    Reads chunks of bytes from the given binary file (a file, a pipe, or a
+    socket file), and feeds each chunk to the given target coroutine as soon as
+    it is read.
+    :param f: file
+    :param target: coroutine
+    :param chunk_size: int
+    :return: None
+    """
+    # read1() returns whatever is available, instead of waiting for a full
+    # chunk
+    read = getattr(f, 'read1', f.read)
+    while True:
+        chunk = read(chunk_size)
+        if not chunk:
+            break
+        target.send(chunk)
+    target.close()
+
+
+def main():
+    route_filter = build_pipeline(
+        stages=[
+            field_equals(field='route', val='22'),
+            field_equals(field='direction', val='North Bound')
+        ],
+        sink=bus_info_printer()
+    )
+    # Standard input stands in for the socket, e.g.:
+    # cat allroutes.xml allroutes.xml | python coexpat_stream.py
+    source_stream(
+        sys.stdin.buffer,
+        target=expat_feed(target=buses_to_dicts(target=route_filter))
+    )
+
+
+if __name__ == '__main__':
+    main()
+
+
+# Output (with allroutes.xml twice in the stream):
+# 22, 1485, North Bound, 41.880481123924255, -87.62948191165924
+# 22, 1629, North Bound, 42.01851969751819, -87.6730209876751
+# ...
+# 22, 1821, North Bound, 41.976410124037, -87.66838073730469
+# 22, 1499, North Bound, 41.96970504369491, -87.66764088166066
+# 22, 1485, North Bound, 41.880481123924255, -87.62948191165924
+# 22, 1629, North Bound, 42.01851969751819, -87.6730209876751
+# ...
+# 22, 1821, North Bound, 41.976410124037, -87.66838073730469
+# 22, 1499, North Bound, 41.96970504369491, -87.66764088166066
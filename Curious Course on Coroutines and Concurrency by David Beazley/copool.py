@@ -0,0 +1,238 @@
+#!usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+An example showing how to scale a coroutine pipeline over a pool of worker
+processes, as an extension to wrapping coroutines within a single subprocess
+like in coprocess.py.
+
+Each worker runs the same pipeline, the items are dispatched to the workers in
+batches, and whatever comes out at the end of the workers' pipelines is
+collected back into a coroutine in the calling process.
+"""
+
+import multiprocessing as mp
+import queue
+import xml.sax
+from itertools import count
+from typing import Callable, Coroutine, Optional
+
+from coqueue import put_checked
+from coroutine import coroutine
+from cosax import EventHandler
+from cosax_bus import (
+    build_pipeline, bus_info_printer, buses_to_dicts, field_equals
+)
+
+DONE = 'done'
+ITEMS = 'items'
+JOIN_TIMEOUT = 1.0  # For the terminated workers to exit (in seconds)
+
+
+def pool_worker(
+    i: int, in_q: mp.Queue, out_q: mp.Queue, target_factory: Callable
+) -> None:
+    """
+    Worker process function to build the pipeline, feed it the batches of items
+    received from the input queue, and put the items coming out of it into the
+    output queue.
+    :param i: int
+    :param in_q: Queue
+    :param out_q: Queue
+    :param target_factory: callable
+    :return: None
+    """
+    out = []
+
+    @coroutine
+    def collector():
+        while True:
+            out.append((yield))
+
+    pipeline = target_factory(target=collector())
+    while True:
+        items = in_q.get()
+        if items is None:  # The pool is closed
+            pipeline.close()
+        else:
+            for item in items:
+                pipeline.send(item)
+        if out:
+            out_q.put((ITEMS, i, out[:]))
+            out.clear()
+        if items is None:
+            out_q.put((DONE, i, None))
+            return
+
+
+@coroutine
+def process_pool(
+    n: int, target_factory: Callable, target: Optional[Coroutine] = None,
+    key: Optional[Callable] = None, batch_size: int = 256
+):
+    """
+    A coroutine that dispatches the received items to a pool of the given
+    number of worker processes, each running the pipeline built by the given
+    factory, and feeds the items coming out of the workers' pipelines to the
+    given target coroutine (if any).
+    The factory is called in each worker with the "target" of the pipeline to
+    build, so it must be picklable where processes are spawned instead of
+    forked.
+    The items are dispatched round-robin, or if a key function is given, by the
+    hash of their key, so that all the items with the same key (e.g., the same
+    route) are handled by the same worker, in order.
+    If a worker dies, a RuntimeError is raised.
+    :param n: int
+    :param target_factory: callable
+    :param target: coroutine
+    :param key: callable
+    :param batch_size: int
+    :return: coroutine
+    """
+    in_qs = [mp.Queue(maxsize=8) for _ in range(n)]
+    out_q = mp.Queue()
+    workers = [
+        mp.Process(
+            target=pool_worker, args=(i, in_qs[i], out_q, target_factory),
+            name=f'process_pool-worker-{i}'
+        )
+        for i in range(n)
+    ]
+    for worker in workers:
+        worker.start()
+    done = set()
+
+    def collect(block: bool) -> None:
+        """
+        Feeds the items collected from the workers to the target, and checks
+        that no worker died.
+        :param block: bool
+        :return: None
+        """
+        while True:
+            try:
+                kind, i, items = out_q.get(timeout=0.1) if block \
+                    else out_q.get_nowait()
+            except queue.Empty:
+                # A worker only exits cleanly after reporting that it is done,
+                # so any other exit means that it died
+                for worker in workers:
+                    if worker.exitcode not in (None, 0):
+                        # Stop the other workers, as the items dispatched to
+                        # the dead worker are lost anyway
+                        for other in workers:
+                            other.terminate()
+                        for other in workers:
+                            other.join(timeout=JOIN_TIMEOUT)
+                        # Nobody reads the input queues anymore, so do not
+                        # wait for their feeder threads to flush them at exit
+                        for q in in_qs:
+                            q.cancel_join_thread()
+                            q.close()
+                        raise RuntimeError(
+                            f'{worker.name} died with exit code '
+                            f'{worker.exitcode}'
+                        )
+                if not block:
+                    return
+                continue
+            if kind == DONE:
+                done.add(i)
+                if block and len(done) == n:
+                    return
+            elif target is not None:
+                for item in items:
+                    target.send(item)
+
+    def dispatch(i: int, items) -> None:
+        """
+        Puts the given items into the queue of the given worker, collecting
+        the workers' output while the queue is full.
+        :param i: int
+        :param items: list or None
+        :return: None
+        """
+        put_checked(in_qs[i], items, lambda: collect(block=False))
+
+    batches = [[] for _ in range(n)]
+    round_robin = count()
+    try:
+        while True:
+            item = yield
+            if key is None:
+                i = next(round_robin) % n
+            else:
+                i = hash(key(item)) % n
+            batch = batches[i]
+            batch.append(item)
+            if len(batch) >= batch_size:
+                dispatch(i, batch)
+                batches[i] = []
+                collect(block=False)
+    except GeneratorExit:
+        for i, batch in enumerate(batches):
+            if batch:
+                dispatch(i, batch)
+            dispatch(i, None)
+        collect(block=True)
+        for worker in workers:
+            worker.join()
+        if target is not None:
+            target.close()
+
+
+def bus_filters(target: Coroutine) -> Coroutine:
+    """
+    Target factory for process_pool(), which builds the filters of the bus
+    information.
+    :param target: coroutine
+    :return: coroutine
+    """
+    return build_pipeline(
+        stages=[
+            field_equals(field='route', val='22'),
+            field_equals(field='direction', val='North Bound')
+        ],
+        sink=target
+    )
+
+
+def route_of(bus: dict) -> str:
+    return bus['route']
+
+
+def main():
+    # Dispatch the buses by route, so that all the buses of a route are kept
+    # in order
+    pool = process_pool(
+        n=2, target_factory=bus_filters, target=bus_info_printer(),
+        key=route_of
+    )
+    xml.sax.parse(
+        source='allroutes.xml',
+        handler=EventHandler(target=buses_to_dicts(target=pool))
+    )
+    pool.close()
+
+
+if __name__ == '__main__':
+    main()
+
+
+# Output:
+# 22, 1485, North Bound, 41.880481123924255, -87.62948191165924
+# 22, 1629, North Bound, 42.01851969751819, -87.6730209876751
+# 22, 1489, North Bound, 41.962393500588156, -87.66610128229314
+# 22, 1533, North Bound, 41.92381583870231, -87.6395345910803
+# 22, 1779, North Bound, 41.989253234863284, -87.66976165771484
+# 22, 1595, North Bound, 41.892801920572914, -87.62985568576389
+# 22, 1567, North Bound, 41.91437446296989, -87.63357444862267
+# 22, 1795, North Bound, 41.98753767747145, -87.66956552358774
+# 22, 1543, North Bound, 41.92852973937988, -87.64240264892578
+# 22, 1315, North Bound, 41.96697834559849, -87.66706085205078
+# 22, 6069, North Bound, 41.98728592755043, -87.66953517966074
+# 22, 1891, North Bound, 41.92987823486328, -87.64342498779297
+# 22, 1569, North Bound, 42.003393713033425, -87.6723536365437
+# 22, 1617, North Bound, 41.90174682617187, -87.63128570556641
+# 22, 1821, North Bound, 41.976410124037, -87.66838073730469
+# 22, 1499, North Bound, 41.96970504369491, -87.66764088166066
@@ -4,12 +4,17 @@
 """
 An example showing how to wrap coroutines within a subprocess.
 The calling process and the new subprocess communicate via a pipe.
+
+By default, the items are sent in the framed, batched transport of
+coframing.py, rather than pickled one by one.
 """
 
 import pickle
 import subprocess
 import xml.sax
+from typing import Optional
 
+from coframing import send_framed
 from coroutine import coroutine
 from cosax import EventHandler
 from cosax_bus import buses_to_dicts
@@ -27,22 +32,34 @@ def send_to(f):
             item = yield
             pickle.dump(item, f)
             f.flush()
-    except StopIteration:
+    except GeneratorExit:
         f.close()
 
 
-def main():
+def main(codec: Optional[str] = 'pickle'):
+    """
+    :param codec: str or None (to pickle the items one by one)
+    """
     # Start a new subprocess, which wraps some connected coroutines, and
     # listening on a pipe.
-    p = subprocess.Popen(['python3', 'coprocess_bus.py'], stdin=subprocess.PIPE)
+    args = ['python3', 'coprocess_bus.py']
+    if codec is not None:
+        args.append(f'--framed={codec}')
+    p = subprocess.Popen(args, stdin=subprocess.PIPE)
 
     # Set a sender coroutine to send data to the pipe that the new subprocess is
     # listening on
-    sender = send_to(p.stdin)
+    if codec is not None:
+        sender = send_framed(p.stdin, codec=codec)
+    else:
+        sender = send_to(p.stdin)
     xml.sax.parse(
         source='allroutes.xml',
         handler=EventHandler(target=buses_to_dicts(target=sender))
     )
+    # Closing the sender closes the pipe, so the subprocess sees EOF
+    sender.close()
+    p.wait()
 
 
 if __name__ == '__main__':
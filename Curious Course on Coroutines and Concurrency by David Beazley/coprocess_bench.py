@@ -0,0 +1,155 @@
+#!usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+A benchmark comparing the transports for sending bus information across a pipe
+to a subprocess, in records per second: one pickle per item as in coprocess.py,
+against the framed, batched transport of coframing.py with each codec, and
+against the shared memory ring buffer of coring.py.
+
+The buses are parsed from allroutes.xml scaled up 100 times beforehand, and the
+subprocess only counts the received buses.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from multiprocessing import Pipe, Process, parent_process
+from multiprocessing.connection import Connection
+
+from coexpat_bus import expat_parse_buses
+from coframing import receive_framed, send_framed
+from coprocess import send_to
+from coprocess_bus import receive_from
+from coring import RingBuffer, receive_from_ring, send_to_ring
+from cosax_bus_bench import collector, counter, make_feed
+
+SCALE = 100
+
+
+def child(transport: str) -> None:
+    """
+    Subprocess function to receive buses from the standard input with the
+    given transport.
+    :param transport: str
+    :return: None
+    """
+    counts = {'buses': 0}
+    if transport == 'per-item pickle':
+        receive_from(sys.stdin.buffer, target=counter(counts))
+    else:
+        receive_framed(
+            sys.stdin.buffer, target=counter(counts),
+            codec=transport.split()[-1]
+        )
+    print(counts['buses'])
+
+
+def ring_child(name: str, codec: str, conn: Connection) -> None:
+    """
+    Subprocess function to receive buses from the ring buffer with the given
+    name, and send back the count.
+    :param name: str
+    :param codec: str
+    :param conn: Connection
+    :return: None
+    """
+    ring = RingBuffer(name=name, peer_alive=parent_process().is_alive)
+    counts = {'buses': 0}
+    receive_from_ring(ring, target=counter(counts), codec=codec)
+    ring.close()
+    conn.send(counts['buses'])
+
+
+def run(transport: str, buses: list) -> None:
+    """
+    Sends the given buses to a subprocess with the given transport, and prints
+    the throughput.
+    :param transport: str
+    :param buses: list
+    :return: None
+    """
+    if transport.startswith('ring'):
+        run_ring(transport, buses)
+        return
+    started_at = time.perf_counter()
+    p = subprocess.Popen(
+        [sys.executable, __file__, '--child', transport],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE
+    )
+    if transport == 'per-item pickle':
+        sender = send_to(p.stdin)
+    else:
+        sender = send_framed(p.stdin, codec=transport.split()[-1])
+    for bus in buses:
+        sender.send(bus)
+    sender.close()
+    received = int(p.stdout.read())
+    p.wait()
+    elapsed = time.perf_counter() - started_at
+    print(
+        f'{transport:<16} {len(buses) / elapsed:>12,.0f} records/sec '
+        f'({received:,} received)'
+    )
+
+
+def run_ring(transport: str, buses: list) -> None:
+    """
+    Sends the given buses to a subprocess via a ring buffer in shared memory,
+    and prints the throughput.
+    :param transport: str
+    :param buses: list
+    :return: None
+    """
+    codec = transport.split()[-1]
+    started_at = time.perf_counter()
+    ring = RingBuffer()
+    parent_conn, child_conn = Pipe()
+    p = Process(target=ring_child, args=(ring.name, codec, child_conn))
+    p.start()
+    ring.peer_alive = p.is_alive
+    sender = send_to_ring(ring, codec=codec)
+    for bus in buses:
+        sender.send(bus)
+    sender.close()
+    received = parent_conn.recv()
+    p.join()
+    ring.close()
+    elapsed = time.perf_counter() - started_at
+    print(
+        f'{transport:<16} {len(buses) / elapsed:>12,.0f} records/sec '
+        f'({received:,} received)'
+    )
+
+
+def main():
+    fd, filename = tempfile.mkstemp(suffix='.xml')
+    os.close(fd)
+    try:
+        make_feed(filename, SCALE)
+        buses = []
+        expat_parse_buses(filename=filename, target=collector(buses))
+    finally:
+        os.remove(filename)
+    for transport in [
+        'per-item pickle', 'framed pickle', 'framed bus', 'ring pickle',
+        'ring bus'
+    ]:
+        run(transport, buses)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--child']:
+        child(sys.argv[2])
+    else:
+        main()
+
+
+# Output (on a single core, where encoding and decoding dominate):
+# per-item pickle        70,152 records/sec (86,300 received)
+# framed pickle         147,395 records/sec (86,300 received)
+# framed bus            133,415 records/sec (86,300 received)
+# ring pickle           153,274 records/sec (86,300 received)
+# ring bus              144,244 records/sec (86,300 received)
@@ -4,13 +4,17 @@
 """
 Subprocess module wrapping coroutines, which communicates with the calling
 process via a pipe.
+
+Run with "--framed=<codec>" to receive the items in the framed, batched
+transport of coframing.py instead of one pickle per item.
 """
 
 import pickle
 import sys
 from typing import Coroutine
 
-from cosax_bus import bus_info_printer, filter_on_field
+from coframing import receive_framed
+from cosax_bus import build_pipeline, bus_info_printer, field_equals
 
 
 def receive_from(f, target: Coroutine) -> None:
@@ -29,9 +33,22 @@ def receive_from(f, target: Coroutine) -> None:
         target.close()
 
 
-printer = bus_info_printer()
-direction_filter = filter_on_field(
-    field='direction', val='North Bound', target=printer
-)
-route_filter = filter_on_field(field='route', val='22', target=direction_filter)
-receive_from(sys.stdin, target=route_filter)
+def main():
+    printer = bus_info_printer()
+    route_filter = build_pipeline(
+        stages=[
+            field_equals(field='route', val='22'),
+            field_equals(field='direction', val='North Bound')
+        ],
+        sink=printer
+    )
+    for arg in sys.argv[1:]:
+        if arg.startswith('--framed'):
+            codec = arg.partition('=')[2] or 'pickle'
+            receive_framed(sys.stdin.buffer, target=route_filter, codec=codec)
+            return
+    receive_from(sys.stdin.buffer, target=route_filter)
+
+
+if __name__ == '__main__':
+    main()
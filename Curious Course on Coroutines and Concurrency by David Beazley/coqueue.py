@@ -0,0 +1,35 @@
+#!usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+A helper for the coroutines which pass items on to a thread or a process
+through a bounded queue, and must not hang forever on a full queue when the
+other side is gone.
+It works with the queues of the queue module as well as with the ones of the
+multiprocessing module, which both raise queue.Full.
+"""
+
+import queue
+from typing import Callable
+
+
+def put_checked(
+    q, item, check: Callable[[], None], interval: float = 0.1
+) -> None:
+    """
+    Puts the given item into the given queue, blocking while the queue is full,
+    but calling the given function every given interval (in seconds) meanwhile,
+    which can raise if the consumer died, or do some other work (e.g., drain
+    an output queue).
+    :param q: Queue
+    :param item: object
+    :param check: callable
+    :param interval: float
+    :return: None
+    """
+    while True:
+        try:
+            q.put(item, timeout=interval)
+            return
+        except queue.Full:
+            check()
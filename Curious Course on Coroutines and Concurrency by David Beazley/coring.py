@@ -0,0 +1,320 @@
+#!usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+An example showing how to connect coroutines in different processes via a
+single-producer / single-consumer ring buffer in shared memory, instead of a
+pipe like in coprocess.py and coprocess_bus.py.
+
+The items are batched and encoded into frames like in coframing.py, and the
+frames are copied straight into the shared memory, without going through the
+kernel.
+
+Note that the ring buffer relies on the memory ordering of x86(-64), where the
+stores of a core are seen by the other cores in the order they were made: a
+side publishes its new position after copying a frame, so the other side never
+sees the position before the frame. Python has no memory barriers, so on CPUs
+with a weaker memory ordering (e.g., ARM or POWER), the position could be seen
+first, and a lock or a pipe (like in coprocess.py) should be used instead.
+Python 3.8+ is needed for multiprocessing.shared_memory and parent_process().
+"""
+
+import struct
+import sys
+import time
+import xml.sax
+from multiprocessing import Process, parent_process
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Coroutine, Optional
+
+from coframing import CODECS, HEADER
+from coroutine import coroutine
+from cosax import EventHandler
+from cosax_bus import (
+    build_pipeline, bus_info_printer, buses_to_dicts, field_equals
+)
+
+POS = struct.Struct('Q')
+# The positions are kept on separate cache lines, so that the producer and the
+# consumer do not keep invalidating each other's cache
+WRITE_POS_OFFSET = 0
+READ_POS_OFFSET = 64
+CLOSED_OFFSET = 128
+DATA_OFFSET = 192
+SPINS_PER_CHECK = 4096  # Spins between liveness checks of the other side
+
+
+class RingBuffer:
+    """
+    Single-producer / single-consumer ring buffer of frames in shared memory.
+    The write and read positions only ever grow, and each side only updates its
+    own position, after copying a whole frame, so no lock is needed.
+    When the buffer is full (for the producer) or empty (for the consumer), the
+    calling side waits: either spinning, which gives the lowest latency but
+    burns a core, or sleeping with an increasing backoff of up to 1ms.
+    While waiting, the given liveness check of the other side (e.g.,
+    Process.is_alive) is polled every so often, so that the calling side fails
+    instead of waiting forever if the other side died.
+    """
+
+    def __init__(
+        self, name: Optional[str] = None, capacity: int = 1 << 20,
+        spin: bool = False, peer_alive: Optional[Callable[[], bool]] = None
+    ):
+        """
+        Creates a new ring buffer with the given capacity (in bytes), or
+        attaches to the existing one with the given name.
+        :param name: str
+        :param capacity: int
+        :param spin: bool
+        :param peer_alive: callable
+        """
+        if name is None:
+            self._shm = SharedMemory(create=True, size=DATA_OFFSET + capacity)
+            self._shm.buf[:DATA_OFFSET] = bytes(DATA_OFFSET)
+        else:
+            # Note that the consumer process should be started with
+            # multiprocessing, so that it shares the resource tracker of the
+            # creator, which otherwise would see the shared memory as leaked
+            self._shm = SharedMemory(name=name)
+        self._owner = name is None
+        self._buf = self._shm.buf
+        self._capacity = self._shm.size - DATA_OFFSET
+        self._spin = spin
+        # Can also be set later, e.g., once the other process is started
+        self.peer_alive = peer_alive
+        # Local copies of the positions of this side
+        self._write_pos = self._get_pos(WRITE_POS_OFFSET)
+        self._read_pos = self._get_pos(READ_POS_OFFSET)
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    def _get_pos(self, offset: int) -> int:
+        return POS.unpack_from(self._buf, offset)[0]
+
+    def _set_pos(self, offset: int, pos: int) -> None:
+        POS.pack_into(self._buf, offset, pos)
+
+    def _wait(self, ready: Callable[[], bool]) -> None:
+        """
+        Waits until the given condition is true, or raises RuntimeError if the
+        other side died in the meantime.
+        :param ready: callable
+        :return: None
+        """
+        delay = 0.0
+        n_checks = 0
+        while not ready():
+            n_checks += 1
+            # The liveness check costs a system call, so it is only done once
+            # in a while when spinning
+            if self.peer_alive is not None and \
+                    (not self._spin or not n_checks % SPINS_PER_CHECK) and \
+                    not self.peer_alive():
+                # The other side may have finished right before dying
+                if ready():
+                    return
+                raise RuntimeError('The other side of the ring buffer died')
+            if self._spin:
+                continue
+            time.sleep(delay)
+            delay = min(delay * 2 or 1e-6, 1e-3)
+
+    def _copy_in(self, pos: int, data) -> None:
+        start = pos % self._capacity
+        first = min(len(data), self._capacity - start)
+        self._buf[DATA_OFFSET + start:DATA_OFFSET + start + first] = \
+            data[:first]
+        if first < len(data):  # Wrap around
+            rest = len(data) - first
+            self._buf[DATA_OFFSET:DATA_OFFSET + rest] = data[first:]
+
+    def _copy_out(self, pos: int, size: int) -> bytes:
+        start = pos % self._capacity
+        first = min(size, self._capacity - start)
+        data = bytes(self._buf[DATA_OFFSET + start:DATA_OFFSET + start + first])
+        if first < size:  # Wrap around
+            data += bytes(self._buf[DATA_OFFSET:DATA_OFFSET + size - first])
+        return data
+
+    def write(self, payload: bytes) -> None:
+        """
+        Writes the given payload as one frame, waiting while the buffer is too
+        full for it.
+        :param payload: bytes
+        :return: None
+        """
+        size = HEADER.size + len(payload)
+        if size > self._capacity:
+            raise ValueError(
+                f'Frame of {size} bytes exceeds the ring buffer capacity of '
+                f'{self._capacity} bytes'
+            )
+        write_pos = self._write_pos
+        if self._capacity - (write_pos - self._read_pos) < size:
+            # Refresh the consumer's position, and wait for it if needed
+            def has_room() -> bool:
+                self._read_pos = self._get_pos(READ_POS_OFFSET)
+                return self._capacity - (write_pos - self._read_pos) >= size
+
+            self._wait(has_room)
+        self._copy_in(write_pos, HEADER.pack(len(payload)))
+        self._copy_in(write_pos + HEADER.size, memoryview(payload))
+        # Publish the frame only after it is fully copied
+        self._write_pos = write_pos + size
+        self._set_pos(WRITE_POS_OFFSET, self._write_pos)
+
+    def read(self) -> Optional[bytes]:
+        """
+        Reads the payload of the next frame, waiting while the buffer is
+        empty, or returns None once the producer closed the buffer and all the
+        frames have been read.
+        :return: bytes or None
+        """
+        read_pos = self._read_pos
+        if self._write_pos == read_pos:
+            # Refresh the producer's position, and wait for it if needed
+            def has_frame_or_closed() -> bool:
+                # The closed flag is checked first, so that a frame written
+                # right before closing is not missed
+                closed = self._get_pos(CLOSED_OFFSET)
+                self._write_pos = self._get_pos(WRITE_POS_OFFSET)
+                return self._write_pos != read_pos or closed
+
+            self._wait(has_frame_or_closed)
+            if self._write_pos == read_pos:  # Closed, and nothing left
+                return None
+        (length,) = HEADER.unpack(self._copy_out(read_pos, HEADER.size))
+        payload = self._copy_out(read_pos + HEADER.size, length)
+        self._read_pos = read_pos + HEADER.size + length
+        self._set_pos(READ_POS_OFFSET, self._read_pos)
+        return payload
+
+    def close_writer(self) -> None:
+        """
+        Marks the end of the stream for the consumer.
+        :return: None
+        """
+        self._set_pos(CLOSED_OFFSET, 1)
+
+    def close(self) -> None:
+        """
+        Detaches from the shared memory, and also frees it if this side created
+        it.
+        :return: None
+        """
+        self._buf = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+@coroutine
+def send_to_ring(
+    ring: RingBuffer, batch_size: int = 256, codec: str = 'pickle'
+):
+    """
+    A coroutine that receives items, and writes them to the given ring buffer in
+    frames of batches of up to the given size.
+    Closing this coroutine writes the last batch, and marks the end of the
+    stream.
+    :param ring: RingBuffer
+    :param batch_size: int
+    :param codec: str
+    :return: coroutine
+    """
+    encode, _ = CODECS[codec]
+    batch = []
+    try:
+        while True:
+            batch.append((yield))
+            if len(batch) >= batch_size:
+                ring.write(encode(batch))
+                batch = []
+    except GeneratorExit:
+        if batch:
+            ring.write(encode(batch))
+        ring.close_writer()
+
+
+def receive_from_ring(
+    ring: RingBuffer, target: Coroutine, codec: str = 'pickle'
+) -> None:
+    """
+    Reads frames from the given ring buffer, and feeds the items in them to the
+    given coroutine, until the end of the stream.
+    :param ring: RingBuffer
+    :param target: coroutine
+    :param codec: str
+    :return: None
+    """
+    _, decode = CODECS[codec]
+    while True:
+        payload = ring.read()
+        if payload is None:
+            break
+        for item in decode(payload):
+            target.send(item)
+    target.close()
+
+
+def consumer(name: str) -> None:
+    """
+    Subprocess function, which wraps some connected coroutines fed from the
+    ring buffer with the given name.
+    :param name: str
+    :return: None
+    """
+    ring = RingBuffer(name=name, peer_alive=parent_process().is_alive)
+    route_filter = build_pipeline(
+        stages=[
+            field_equals(field='route', val='22'),
+            field_equals(field='direction', val='North Bound')
+        ],
+        sink=bus_info_printer()
+    )
+    try:
+        receive_from_ring(ring, target=route_filter)
+    finally:
+        ring.close()
+        sys.stdout.flush()
+
+
+def main():
+    ring = RingBuffer()
+    p = Process(target=consumer, args=(ring.name,))
+    p.start()
+    ring.peer_alive = p.is_alive
+    sender = send_to_ring(ring)
+    xml.sax.parse(
+        source='allroutes.xml',
+        handler=EventHandler(target=buses_to_dicts(target=sender))
+    )
+    sender.close()
+    p.join()
+    ring.close()
+
+
+if __name__ == '__main__':
+    main()
+
+
+# Output:
+# 22, 1485, North Bound, 41.880481123924255, -87.62948191165924
+# 22, 1629, North Bound, 42.01851969751819, -87.6730209876751
+# 22, 1489, North Bound, 41.962393500588156, -87.66610128229314
+# 22, 1533, North Bound, 41.92381583870231, -87.6395345910803
+# 22, 1779, North Bound, 41.989253234863284, -87.66976165771484
+# 22, 1595, North Bound, 41.892801920572914, -87.62985568576389
+# 22, 1567, North Bound, 41.91437446296989, -87.63357444862267
+# 22, 1795, North Bound, 41.98753767747145, -87.66956552358774
+# 22, 1543, North Bound, 41.92852973937988, -87.64240264892578
+# 22, 1315, North Bound, 41.96697834559849, -87.66706085205078
+# 22, 6069, North Bound, 41.98728592755043, -87.66953517966074
+# 22, 1891, North Bound, 41.92987823486328, -87.64342498779297
+# 22, 1569, North Bound, 42.003393713033425, -87.6723536365437
+# 22, 1617, North Bound, 41.90174682617187, -87.63128570556641
+# 22, 1821, North Bound, 41.976410124037, -87.66838073730469
+# 22, 1499, North Bound, 41.96970504369491, -87.66764088166066
@@ -0,0 +1,110 @@
+#!usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+A benchmark showing that the instrumentation of the coroutine() decorator costs
+nothing when it is switched off.
+A pipeline of three coroutines is created and fed with items: primed by hand
+(as before the decorator grew the instrumentation), decorated with the
+instrumentation switched off, and decorated with it switched on.
+"""
+
+import inspect
+import time
+from typing import Callable, Tuple
+
+from coroutine import coroutine
+
+N_ITEMS = 1_000_000
+N_PIPELINES = 100_000
+ROUNDS = 5
+
+
+def increment(target):
+    while True:
+        target.send((yield) + 1)
+
+
+def double(target):
+    while True:
+        target.send((yield) * 2)
+
+
+def sink(counts: dict):
+    while True:
+        yield
+        counts['items'] += 1
+
+
+def primed(func: Callable) -> Callable:
+    """
+    Primes the coroutines by hand, like the decorator did before.
+    :param func: callable
+    :return: callable
+    """
+    def auto_start_func(*args, **kwargs):
+        coro = func(*args, **kwargs)
+        coro.send(None)
+        return coro
+    return auto_start_func
+
+
+def run(decorate: Callable) -> Tuple[float, float]:
+    """
+    Creates and feeds pipelines with the coroutines decorated with the given
+    decorator, and returns the throughputs.
+    :param decorate: callable
+    :return: tuple(float, float)
+    """
+    make_increment, make_double, make_sink = \
+        decorate(increment), decorate(double), decorate(sink)
+    counts = {'items': 0}
+    started_at = time.perf_counter()
+    for _ in range(N_PIPELINES):
+        make_increment(make_double(make_sink(counts)))
+    create_elapsed = time.perf_counter() - started_at
+    pipeline = make_increment(make_double(make_sink(counts)))
+    started_at = time.perf_counter()
+    for i in range(N_ITEMS):
+        pipeline.send(i)
+    send_elapsed = time.perf_counter() - started_at
+    return N_PIPELINES / create_elapsed, N_ITEMS / send_elapsed
+
+
+def main():
+    # Switched off, the decorator hands out the plain generators
+    assert inspect.isgenerator(coroutine(instrument=False)(sink)({}))
+    decorators = {
+        'primed by hand': primed,
+        'instrument=False': coroutine(instrument=False),
+        'instrument=True': coroutine(instrument=True),
+    }
+    # Keep the best of several interleaved rounds, to smooth out the noise
+    best = {label: (0.0, 0.0) for label in decorators}
+    for _ in range(ROUNDS):
+        for label, decorate in decorators.items():
+            create_rate, send_rate = run(decorate)
+            best[label] = (
+                max(best[label][0], create_rate), max(best[label][1], send_rate)
+            )
+    for label, (create_rate, send_rate) in best.items():
+        print(
+            f'{label:<20} {create_rate:>12,.0f} pipelines/sec '
+            f'{send_rate:>12,.0f} items/sec'
+        )
+
+
+if __name__ == '__main__':
+    main()
+
+
+# Output (on a single core):
+# primed by hand            336,808 pipelines/sec    2,920,702 items/sec
+# instrument=False          370,278 pipelines/sec    3,064,323 items/sec
+# instrument=True           262,636 pipelines/sec    1,035,237 items/sec
+#
+# Note:
+# Switched off, the decorator is the same code as before, and the coroutines
+# are plain generators, so the differences between the first two rows are
+# noise (about 10% from run to run). Switched on, every send goes through a
+# Python-level wrapper, which makes the sends about 3 times slower.
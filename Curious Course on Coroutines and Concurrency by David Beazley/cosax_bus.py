@@ -3,21 +3,119 @@
 
 """
 An example showing how to dispatch SAX events into a pipeline of coroutines.
+
+Chains of filter stages can also be fused into a single compiled filter stage
+by build_pipeline(), so that each bus resumes only one generator no matter how
+many conditions are checked.
 """
 
+import re
+import sys
 import xml.sax
-from typing import Coroutine
+from functools import partial
+from typing import Callable, Coroutine, List, NamedTuple, Optional, Union
 
 from coroutine import coroutine
 from cosax import EventHandler
 
 
+class BusRecord:
+    """
+    Compact record of bus information, which can be used in place of a bus
+    information dictionary.
+    The known fields are stored in slots, so there is no per-bus dictionary
+    with repeated keys. Like in a dictionary, the field values are the raw
+    strings, and value() parses the numeric ones only when asked for.
+    """
+    FIELDS = (
+        'id', 'route', 'actualRoute', 'color', 'revenue', 'direction',
+        'latitude', 'longitude', 'pattern', 'patternDirection', 'run',
+        'finalStop', 'operator'
+    )
+    NUMERIC_FIELDS = {
+        'id': int, 'latitude': float, 'longitude': float, 'pattern': int,
+        'operator': int
+    }
+
+    _KNOWN_FIELDS = frozenset(FIELDS)
+    _INTERNED_FIELDS = frozenset((
+        'route', 'actualRoute', 'color', 'revenue', 'direction',
+        'patternDirection', 'finalStop'
+    ))
+
+    __slots__ = FIELDS + ('_extra',)
+
+    def __init__(self):
+        self._extra = None  # Unknown fields, only allocated when needed
+
+    def store(self, field: str, val: str) -> None:
+        """
+        Stores the given raw string value of the given field.
+        The values of the fields with only a few distinct values (like the route
+        or the direction) are interned, so that all the records share them.
+        :param field: str
+        :param val: str
+        :return: None
+        """
+        if field in self._INTERNED_FIELDS:
+            setattr(self, field, sys.intern(val))
+        elif field in self._KNOWN_FIELDS:
+            setattr(self, field, val)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[field] = val
+
+    __setitem__ = store
+
+    def __getitem__(self, field: str) -> str:
+        val = self.get(field)
+        if val is None:
+            raise KeyError(field)
+        return val
+
+    def get(self, field: str, default=None):
+        """
+        Returns the raw string value of the given field, like dict.get().
+        :param field: str
+        :param default: object
+        :return: object
+        """
+        if field in self._KNOWN_FIELDS:
+            return getattr(self, field, default)
+        if self._extra is None:
+            return default
+        return self._extra.get(field, default)
+
+    def value(self, field: str) -> Union[str, int, float, None]:
+        """
+        Returns the value of the given field, parsing it if it is numeric.
+        :param field: str
+        :return: str or int or float or None
+        """
+        val = self.get(field)
+        parse = self.NUMERIC_FIELDS.get(field)
+        if val is None or parse is None:
+            return val
+        return parse(val)
+
+    def __repr__(self):
+        fields = ', '.join(
+            f'{field}={getattr(self, field)!r}'
+            for field in self.FIELDS if hasattr(self, field)
+        )
+        return f'BusRecord({fields})'
+
+
 @coroutine
-def buses_to_dicts(target: Coroutine):
+def buses_to_dicts(target: Coroutine, as_records: bool = False):
     """
     A coroutine that collects bus information as a dictionary and feeds it to
     the given target coroutine.
+    In record mode, the bus information is collected as a compact BusRecord
+    instead.
     :param target: coroutine
+    :param as_records: bool
     :return: coroutine
     """
     # State A: Looking for a bus
@@ -25,7 +123,7 @@ def buses_to_dicts(target: Coroutine):
         event, val = yield
         if event == 'start' and val[0] == 'bus':
             # State B: Collecting bus information as a dictionary
-            bus_dict = {}
+            bus_dict = BusRecord() if as_records else {}
             fragments = []
             while True:
                 event, val = yield
@@ -57,6 +155,154 @@ def filter_on_field(field: str, val: str, target: Coroutine):
             target.send(d)
 
 
+class Condition(NamedTuple):
+    """
+    A condition on a field of the bus information, to be checked by a compiled
+    filter stage.
+    The supported operators are "eq" (equal to the argument), "in" (one of the
+    argument values), "range" (numerically within the argument (low, high)
+    bounds, inclusive) and "regex" (matching the argument regex).
+    """
+    field: str
+    op: str
+    arg: object
+
+
+def field_equals(field: str, val: str) -> Condition:
+    """
+    :param field: str
+    :param val: str
+    :return: Condition
+    """
+    return Condition(field, 'eq', val)
+
+
+def field_in(field: str, vals: List[str]) -> Condition:
+    """
+    :param field: str
+    :param vals: list[str]
+    :return: Condition
+    """
+    return Condition(field, 'in', frozenset(vals))
+
+
+def field_between(field: str, low: float, high: float) -> Condition:
+    """
+    :param field: str
+    :param low: float
+    :param high: float
+    :return: Condition
+    """
+    return Condition(field, 'range', (low, high))
+
+
+def field_matches(field: str, pattern: str) -> Condition:
+    """
+    :param field: str
+    :param pattern: str
+    :return: Condition
+    """
+    return Condition(field, 'regex', re.compile(pattern))
+
+
+def compile_condition(condition: Condition) -> Callable:
+    """
+    Compiles the given condition into a predicate on the bus information.
+    :param condition: Condition
+    :return: callable
+    """
+    field, op, arg = condition
+    if op == 'eq':
+        return lambda d: d.get(field, None) == arg
+    if op == 'in':
+        return lambda d: d.get(field, None) in arg
+    if op == 'range':
+        low, high = arg
+
+        def in_range(d) -> bool:
+            try:
+                return low <= float(d.get(field, None)) <= high
+            except (TypeError, ValueError):  # Missing or not numeric
+                return False
+
+        return in_range
+    if op == 'regex':
+        return lambda d: arg.search(d.get(field, None) or '') is not None
+    raise ValueError(f'Unknown condition operator: {op}')
+
+
+@coroutine
+def compiled_filter(conditions: List[Condition], target: Coroutine):
+    """
+    A coroutine that filters the received bus information on all the given
+    conditions at once, and feeds the filtered bus information to the given
+    target coroutine.
+    :param conditions: list[Condition]
+    :param target: coroutine
+    :return: coroutine
+    """
+    # The equality conditions, which are the most common, are checked together
+    # with a single tuple comparison
+    eq_fields = tuple(cond.field for cond in conditions if cond.op == 'eq')
+    eq_vals = tuple(cond.arg for cond in conditions if cond.op == 'eq')
+    checks = [
+        compile_condition(cond) for cond in conditions if cond.op != 'eq'
+    ]
+    while True:
+        d = yield
+        if tuple(d.get(field, None) for field in eq_fields) != eq_vals:
+            continue
+        for check in checks:
+            if not check(d):
+                break
+        else:
+            target.send(d)
+
+
+def as_condition(stage) -> Optional[Condition]:
+    """
+    Returns the condition checked by the given pipeline stage, if it is a
+    filter stage, or None otherwise.
+    :param stage: Condition or callable
+    :return: Condition or None
+    """
+    if isinstance(stage, Condition):
+        return stage
+    if isinstance(stage, partial) and stage.func is filter_on_field \
+            and not stage.args:
+        return field_equals(stage.keywords['field'], stage.keywords['val'])
+    return None
+
+
+def build_pipeline(stages: list, sink: Coroutine) -> Coroutine:
+    """
+    Builds a pipeline of the given stages in order, ending with the given sink
+    coroutine, and returns the first coroutine of the pipeline.
+    Each stage is either a Condition, or a callable that builds a coroutine
+    given its target coroutine, like functools.partial(filter_on_field,
+    field='route', val='22').
+    Any chain of adjacent filter stages (conditions, or partials of
+    filter_on_field()) is fused into a single compiled_filter() stage.
+    :param stages: list
+    :param sink: coroutine
+    :return: coroutine
+    """
+    target = sink
+    chain = []  # Conditions of the current filter chain, in reverse order
+    for stage in reversed(stages):
+        condition = as_condition(stage)
+        if condition is not None:
+            chain.append(condition)
+            continue
+        if chain:
+            target = compiled_filter(conditions=chain[::-1], target=target)
+            chain = []
+        target = stage(target=target)
+    if chain:
+        target = compiled_filter(conditions=chain[::-1], target=target)
+    return target
+
+
 @coroutine
 def bus_info_printer():
     """
@@ -72,11 +318,13 @@ def bus_info_printer():
 
 
 def main():
-    direction_filter = filter_on_field(
-        field='direction', val='North Bound', target=bus_info_printer()
-    )
-    route_filter = filter_on_field(
-        field='route', val='22', target=direction_filter
+    # The two filter stages are fused into one compiled filter stage
+    route_filter = build_pipeline(
+        stages=[
+            field_equals(field='route', val='22'),
+            field_equals(field='direction', val='North Bound')
+        ],
+        sink=bus_info_printer()
     )
     xml.sax.parse(
         source='allroutes.xml',
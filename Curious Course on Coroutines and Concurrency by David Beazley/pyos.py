@@ -0,0 +1,404 @@
+#!usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+A minimal operating system of tasks on top of generators, like the one built in
+the last part of the course, as a lightweight alternative runtime to asyncio.
+
+- A task is a generator, which runs until it yields:
+  - None, to let the other tasks run
+  - A system call, to ask the scheduler for something (see below), whose
+    result is sent back into the task
+  - Another generator, which is run as a subroutine (trampolining), and whose
+    return value is sent back into the task
+  Subroutines can also simply be called with "yield from".
+- System calls:
+  - Spawn(gen): Starts a new task, and returns it
+  - Wait(task): Waits for the given task to finish, and returns its return
+    value (or raises its exception)
+  - Sleep(seconds): Sleeps for the given time
+  - ReadWait(f) / WriteWait(f): Waits for the given file (e.g., a socket) to
+    be readable / writable, via the selectors module
+- The scheduler runs the ready tasks in turn, and polls for I/O and wakes up
+  the sleeping tasks whenever no task is ready (or every so often otherwise).
+"""
+
+import heapq
+import selectors
+import socket
+import sys
+import time
+import traceback
+from collections import deque
+from itertools import count
+from types import GeneratorType
+from typing import Dict, Generator, Optional
+
+POLL_EVERY = 64  # Task switches between polls when there are ready tasks
+
+
+class Task:
+    """
+    Task wrapping a generator, with the stack of its running subroutines.
+    """
+    __slots__ = (
+        'tid', 'target', 'stack', 'sendval', 'error', 'done', 'result',
+        'exception', 'waiters'
+    )
+    _ids = count(1)
+
+    def __init__(self, target: Generator):
+        self.tid = next(Task._ids)
+        self.target = target
+        self.stack = []
+        self.sendval = None  # The value to send into the task on its next run
+        self.error = None  # The exception to throw into it instead
+        self.done = False
+        self.result = None
+        self.exception = None
+        self.waiters = []
+
+    def __repr__(self):
+        return f'<Task {self.tid}>'
+
+    def step(self):
+        """
+        Runs the task until it yields None or a system call, which is returned,
+        running the subroutines it yields on the way.
+        Raises StopIteration (or the exception of the task) once the task is
+        over.
+        :return: SystemCall or None
+        """
+        value, error = self.sendval, self.error
+        self.sendval = self.error = None
+        while True:
+            try:
+                if error is None:
+                    yielded = self.target.send(value)
+                else:
+                    yielded, error = self.target.throw(error), None
+            except StopIteration as e:
+                if not self.stack:
+                    raise
+                # Return from a subroutine
+                self.target = self.stack.pop()
+                value = e.value
+                continue
+            except Exception as e:
+                if not self.stack:
+                    raise
+                # Propagate the exception from a subroutine to its caller
+                self.target = self.stack.pop()
+                value, error = None, e
+                continue
+            if type(yielded) is GeneratorType:
+                # Call a subroutine
+                self.stack.append(self.target)
+                self.target = yielded
+                value = None
+                continue
+            return yielded
+
+
+class SystemCall:
+    """
+    Base class of the system calls, which a task yields to the scheduler.
+    """
+
+    def handle(self, sched: 'Scheduler', task: Task) -> None:
+        raise NotImplementedError
+
+
+class Spawn(SystemCall):
+    def __init__(self, target: Generator):
+        self.target = target
+
+    def handle(self, sched: 'Scheduler', task: Task) -> None:
+        task.sendval = sched.spawn(self.target)
+        sched.ready.append(task)
+
+
+class Wait(SystemCall):
+    def __init__(self, task: Task):
+        self.task = task
+
+    def handle(self, sched: 'Scheduler', task: Task) -> None:
+        waited = self.task
+        if waited.done:
+            sched.unretrieved.discard(waited)
+            task.sendval, task.error = waited.result, waited.exception
+            sched.ready.append(task)
+        else:
+            waited.waiters.append(task)
+
+
+class Sleep(SystemCall):
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+    def handle(self, sched: 'Scheduler', task: Task) -> None:
+        deadline = time.monotonic() + self.seconds
+        heapq.heappush(sched.sleeping, (deadline, task.tid, task))
+
+
+class ReadWait(SystemCall):
+    def __init__(self, f):
+        self.f = f
+
+    def handle(self, sched: 'Scheduler', task: Task) -> None:
+        sched.wait_for_io(self.f, selectors.EVENT_READ, task)
+
+
+class WriteWait(SystemCall):
+    def __init__(self, f):
+        self.f = f
+
+    def handle(self, sched: 'Scheduler', task: Task) -> None:
+        sched.wait_for_io(self.f, selectors.EVENT_WRITE, task)
+
+
+class Scheduler:
+    """
+    Scheduler of tasks.
+    """
+
+    def __init__(self):
+        self.ready = deque()
+        self.sleeping = []  # Heap of (deadline, tid, task)
+        self.selector = selectors.DefaultSelector()
+        # The tasks waiting for I/O, by file descriptor and event
+        self.io_waiting: Dict[int, Dict[int, Task]] = {}
+        self.n_tasks = 0
+        # The tasks which failed while no other task was waiting for them
+        self.unretrieved = set()
+
+    def spawn(self, target: Generator) -> Task:
+        """
+        Starts a new task running the given generator.
+        :param target: generator
+        :return: Task
+        """
+        task = Task(target)
+        self.n_tasks += 1
+        self.ready.append(task)
+        return task
+
+    def wait_for_io(self, f, event: int, task: Task) -> None:
+        """
+        Makes the given task wait for the given event on the given file.
+        :param f: file
+        :param event: int
+        :param task: Task
+        :return: None
+        """
+        fd = f if isinstance(f, int) else f.fileno()
+        waiting = self.io_waiting.get(fd)
+        if waiting is None:
+            self.io_waiting[fd] = {event: task}
+            self.selector.register(fd, event)
+        else:
+            # Another task waits for the other event on the same file
+            waiting[event] = task
+            self.selector.modify(fd, sum(waiting))
+
+    def _poll(self, block: bool) -> None:
+        """
+        Wakes up the tasks whose I/O is ready or whose sleep is over, waiting
+        for one if blocking.
+        :param block: bool
+        :return: None
+        """
+        timeout = 0
+        if block:
+            if self.sleeping:
+                timeout = max(0.0, self.sleeping[0][0] - time.monotonic())
+            elif self.io_waiting:
+                timeout = None
+            else:
+                raise RuntimeError(
+                    f'Deadlock: {self.n_tasks} tasks, all waiting for each '
+                    f'other'
+                )
+        if self.io_waiting:
+            for key, events in self.selector.select(timeout):
+                waiting = self.io_waiting[key.fd]
+                for event in (selectors.EVENT_READ, selectors.EVENT_WRITE):
+                    if events & event and event in waiting:
+                        self.ready.append(waiting.pop(event))
+                if waiting:
+                    self.selector.modify(key.fd, sum(waiting))
+                else:
+                    del self.io_waiting[key.fd]
+                    self.selector.unregister(key.fd)
+        elif timeout:
+            time.sleep(timeout)
+        if self.sleeping:
+            now = time.monotonic()
+            while self.sleeping and self.sleeping[0][0] <= now:
+                self.ready.append(heapq.heappop(self.sleeping)[2])
+
+    def _exit(self, task: Task, result, exception: Optional[Exception]):
+        self.n_tasks -= 1
+        task.done = True
+        task.result, task.exception = result, exception
+        task.target = task.stack = None
+        if exception is not None and not task.waiters:
+            self.unretrieved.add(task)
+        for waiter in task.waiters:
+            waiter.sendval, waiter.error = result, exception
+            self.ready.append(waiter)
+        task.waiters = []
+
+    def run(self) -> None:
+        """
+        Runs the tasks until they are all over.
+        :return: None
+        """
+        ready = self.ready
+        switches = 0
+        while self.n_tasks:
+            switches += 1
+            if not ready or not switches % POLL_EVERY:
+                self._poll(block=not ready)
+                if not ready:
+                    continue
+            task = ready.popleft()
+            try:
+                call = task.step()
+            except StopIteration as e:
+                self._exit(task, e.value, None)
+                continue
+            except Exception as e:
+                self._exit(task, None, e)
+                continue
+            if call is None:
+                ready.append(task)
+            else:
+                call.handle(self, task)
+        for task in self.unretrieved:
+            print(f'Exception in {task}, never retrieved:', file=sys.stderr)
+            e = task.exception
+            traceback.print_exception(type(e), e, e.__traceback__)
+        self.unretrieved.clear()
+
+
+# Subroutines for non-blocking sockets, to be called with "yield from" (or
+# yielded).
+# They first try the operation right away, and only wait for the socket when it
+# would block, which saves a trip through the scheduler most of the time.
+
+
+def accept(sock: socket.socket):
+    while True:
+        try:
+            conn, addr = sock.accept()
+        except BlockingIOError:
+            yield ReadWait(sock)
+        else:
+            conn.setblocking(False)
+            return conn, addr
+
+
+def connect(sock: socket.socket, address: tuple):
+    try:
+        sock.connect(address)
+    except BlockingIOError:
+        yield WriteWait(sock)
+        err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err:
+            raise OSError(err, f'Connect call failed {address}')
+
+
+def recv(sock: socket.socket, n: int):
+    while True:
+        try:
+            return sock.recv(n)
+        except BlockingIOError:
+            yield ReadWait(sock)
+
+
+def sendall(sock: socket.socket, data: bytes):
+    view = memoryview(data)
+    while view:
+        try:
+            view = view[sock.send(view):]
+        except BlockingIOError:
+            yield WriteWait(sock)
+
+
+def echo_server(sock: socket.socket, n_clients: int):
+    with sock:
+        for _ in range(n_clients):
+            conn, _ = yield from accept(sock)
+            yield Spawn(echo_handler(conn))
+
+
+def echo_handler(conn: socket.socket):
+    with conn:
+        while True:
+            data = yield from recv(conn, 65536)
+            if not data:
+                break
+            yield from sendall(conn, data)
+
+
+def echo_client(address: tuple, messages: list):
+    sock = socket.socket()
+    sock.setblocking(False)
+    with sock:
+        yield from connect(sock, address)
+        for message in messages:
+            yield from sendall(sock, message)
+            reply = b''
+            while len(reply) < len(message):
+                # Yielded, instead of called with "yield from"
+                reply += yield recv(sock, 65536)
+            print(f'Echoed: {reply}')
+
+
+def countdown(name: str, n: int, interval: float):
+    while n > 0:
+        print(f'{name}: T-minus {n}')
+        yield Sleep(interval)
+        n -= 1
+    return f'{name} is done'
+
+
+def main():
+    def launcher():
+        tasks = [
+            (yield Spawn(countdown('A', 3, 0.1))),
+            (yield Spawn(countdown('B', 2, 0.15))),
+        ]
+        for task in tasks:
+            print((yield Wait(task)))
+
+        server_sock = socket.socket()
+        server_sock.bind(('127.0.0.1', 0))
+        server_sock.listen()
+        server_sock.setblocking(False)
+        address = server_sock.getsockname()
+        yield Spawn(echo_server(server_sock, n_clients=2))
+        yield Spawn(echo_client(address, [b'Hello', b'world!']))
+        yield Spawn(echo_client(address, [b'Goodbye']))
+
+    sched = Scheduler()
+    sched.spawn(launcher())
+    sched.run()
+
+
+if __name__ == '__main__':
+    main()
+
+
+# Output:
+# A: T-minus 3
+# B: T-minus 2
+# A: T-minus 2
+# B: T-minus 1
+# A: T-minus 1
+# A is done
+# B is done
+# Echoed: b'Hello'
+# Echoed: b'Goodbye'
+# Echoed: b'world!'
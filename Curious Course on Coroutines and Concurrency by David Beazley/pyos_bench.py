@@ -0,0 +1,194 @@
+#!usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+A benchmark of the generator-based scheduler of pyos.py against asyncio, in
+operations per second:
+- spawn: Starting tasks which do nothing, and waiting for them
+- context switches: Tasks taking turns with a plain "yield" (and with
+  asyncio.sleep(0) on asyncio)
+- TCP echo: Round trips of small messages with a local echo server, over
+  non-blocking sockets (loop.sock_recv() and loop.sock_sendall() on asyncio,
+  which is the same level as pyos.py, and also its streams)
+"""
+
+import asyncio
+import socket
+import time
+
+from pyos import (
+    Scheduler, Spawn, Wait, accept, connect, echo_handler, recv, sendall
+)
+
+N_TASKS = 100_000
+N_SWITCHES = 200_000
+N_ROUND_TRIPS = 20_000
+MESSAGE = b'x' * 64
+
+
+def listening_socket() -> socket.socket:
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    sock.listen()
+    sock.setblocking(False)
+    return sock
+
+
+def run_pyos(gen):
+    sched = Scheduler()
+    task = sched.spawn(gen)
+    sched.run()
+    return task.result
+
+
+def pyos_spawn():
+    def nothing():
+        return
+        yield
+
+    started_at = time.perf_counter()
+    tasks = []
+    for _ in range(N_TASKS):
+        tasks.append((yield Spawn(nothing())))
+    for task in tasks:
+        yield Wait(task)
+    return N_TASKS / (time.perf_counter() - started_at)
+
+
+def pyos_switches():
+    def player(n: int):
+        for _ in range(n):
+            yield
+
+    started_at = time.perf_counter()
+    ping = yield Spawn(player(N_SWITCHES // 2))
+    pong = yield Spawn(player(N_SWITCHES // 2))
+    yield Wait(ping)
+    yield Wait(pong)
+    return N_SWITCHES / (time.perf_counter() - started_at)
+
+
+def pyos_tcp_echo():
+    server_sock = listening_socket()
+
+    def server():
+        conn, _ = yield from accept(server_sock)
+        server_sock.close()
+        yield from echo_handler(conn)
+
+    yield Spawn(server())
+    sock = socket.socket()
+    sock.setblocking(False)
+    with sock:
+        yield from connect(sock, server_sock.getsockname())
+        started_at = time.perf_counter()
+        for _ in range(N_ROUND_TRIPS):
+            yield from sendall(sock, MESSAGE)
+            received = 0
+            while received < len(MESSAGE):
+                received += len((yield from recv(sock, 4096)))
+        return N_ROUND_TRIPS / (time.perf_counter() - started_at)
+
+
+async def asyncio_spawn() -> float:
+    async def nothing() -> None:
+        pass
+
+    started_at = time.perf_counter()
+    tasks = [asyncio.create_task(nothing()) for _ in range(N_TASKS)]
+    for task in tasks:
+        await task
+    return N_TASKS / (time.perf_counter() - started_at)
+
+
+async def asyncio_switches() -> float:
+    async def player(n: int) -> None:
+        for _ in range(n):
+            await asyncio.sleep(0)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(player(N_SWITCHES // 2), player(N_SWITCHES // 2))
+    return N_SWITCHES / (time.perf_counter() - started_at)
+
+
+async def asyncio_sock_echo() -> float:
+    loop = asyncio.get_running_loop()
+    server_sock = listening_socket()
+
+    async def server() -> None:
+        conn, _ = await loop.sock_accept(server_sock)
+        server_sock.close()
+        with conn:
+            while True:
+                data = await loop.sock_recv(conn, 65536)
+                if not data:
+                    break
+                await loop.sock_sendall(conn, data)
+
+    server_task = asyncio.create_task(server())
+    sock = socket.socket()
+    sock.setblocking(False)
+    with sock:
+        await loop.sock_connect(sock, server_sock.getsockname())
+        started_at = time.perf_counter()
+        for _ in range(N_ROUND_TRIPS):
+            await loop.sock_sendall(sock, MESSAGE)
+            received = 0
+            while received < len(MESSAGE):
+                received += len(await loop.sock_recv(sock, 4096))
+        elapsed = time.perf_counter() - started_at
+    await server_task
+    return N_ROUND_TRIPS / elapsed
+
+
+async def asyncio_stream_echo() -> float:
+    async def echo(reader, writer) -> None:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(echo, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    async with server:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        started_at = time.perf_counter()
+        for _ in range(N_ROUND_TRIPS):
+            writer.write(MESSAGE)
+            await reader.readexactly(len(MESSAGE))
+        elapsed = time.perf_counter() - started_at
+        writer.close()
+        await writer.wait_closed()
+    return N_ROUND_TRIPS / elapsed
+
+
+def main():
+    rows = [
+        ('spawn (tasks/sec)', run_pyos(pyos_spawn()),
+         asyncio.run(asyncio_spawn())),
+        ('context switches (switches/sec)', run_pyos(pyos_switches()),
+         asyncio.run(asyncio_switches())),
+        ('TCP echo, sockets (round trips/sec)', run_pyos(pyos_tcp_echo()),
+         asyncio.run(asyncio_sock_echo())),
+        ('TCP echo, streams (round trips/sec)', None,
+         asyncio.run(asyncio_stream_echo())),
+    ]
+    print(f'{"benchmark":<38}{"pyos":>12}{"asyncio":>12}')
+    for label, pyos_rate, asyncio_rate in rows:
+        pyos_column = '-' if pyos_rate is None else f'{pyos_rate:,.0f}'
+        print(f'{label:<38}{pyos_column:>12}{asyncio_rate:>12,.0f}')
+
+
+if __name__ == '__main__':
+    main()
+
+
+# Output (on a single core):
+# benchmark                                     pyos     asyncio
+# spawn (tasks/sec)                          175,894     107,960
+# context switches (switches/sec)          2,076,173     252,848
+# TCP echo, sockets (round trips/sec)         25,893      12,765
+# TCP echo, streams (round trips/sec)              -      24,425
@@ -0,0 +1,518 @@
+#!usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+A reusable async HTTP/1.1 fetcher, as an extension to the "wget" demo in
+yield_from_and_asyncio.py, which opens a new connection for every request.
+
+The fetcher keeps the connections alive, in a pool per host, so that the
+following requests to the same host skip connecting.
+The number of requests in flight is capped both globally and per host with
+semaphores, and connecting and reading the response have their own timeouts.
+
+The body of a response can also be streamed, in chunks of bounded size, for
+example into a coroutine pipeline like in copipe.py, so that a large body is
+never held in memory as a whole.
+
+The demo runs against the local server of local_http_server.py.
+"""
+
+import asyncio
+import os
+import sys
+from asyncio import StreamReader, StreamWriter
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import (
+    AsyncIterator, Awaitable, Coroutine, Dict, Generator, Optional, Tuple
+)
+from urllib.parse import urlsplit
+
+from local_http_server import start_local_server
+
+# The coroutine pipelines are built with the stages of the course's examples
+sys.path.append(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    'Curious Course on Coroutines and Concurrency by David Beazley'
+))
+from copipe import grep, printer  # noqa: E402
+from coroutine import coroutine  # noqa: E402
+
+# Statuses whose responses never have a body
+NO_BODY_STATUSES = {204, 304}
+
+
+async def with_timeout(aw: Awaitable, timeout: float):
+    """
+    Awaits the given awaitable within the given timeout, raising
+    asyncio.TimeoutError on expiry.
+    asyncio.timeout() (from Python 3.11) is preferred over asyncio.wait_for(),
+    which wraps the awaitable in a new task, as the body of a response may take
+    many reads.
+    :param aw: awaitable
+    :param timeout: float
+    :return: object
+    """
+    if hasattr(asyncio, 'timeout'):
+        async with asyncio.timeout(timeout):
+            return await aw
+    return await asyncio.wait_for(aw, timeout=timeout)
+
+
+class Response:
+    """
+    HTTP response, with the header names in lowercase.
+    """
+
+    def __init__(
+        self, status: int, reason: str, headers: Dict[str, str], body: bytes
+    ):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+
+    def __repr__(self):
+        return (
+            f'<Response {self.status} {self.reason} ({len(self.body)} bytes)>'
+        )
+
+
+class Connection:
+    """
+    Connection to a host, which can be reused for several requests.
+    """
+
+    def __init__(self, reader: StreamReader, writer: StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    @property
+    def usable(self) -> bool:
+        return not self.writer.is_closing() and not self.reader.at_eof()
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class HostPool:
+    """
+    Idle connections to a host, and the semaphore capping the number of
+    requests in flight to it.
+    """
+
+    def __init__(self, max_per_host: int):
+        self.idle = deque()
+        self.semaphore = asyncio.Semaphore(max_per_host)
+
+
+def parse_url(url: str) -> Tuple[str, str, int, bool, str]:
+    """
+    Splits the given URL into the "Host" header, the host, the port, whether
+    to use TLS, and the path (with the query).
+    :param url: str
+    :return: tuple(str, str, int, bool, str)
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https'):
+        raise ValueError(f'Unsupported URL {url!r}')
+    ssl = parts.scheme == 'https'
+    port = parts.port or (443 if ssl else 80)
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+    return parts.netloc, parts.hostname, port, ssl, path
+
+
+def parse_response_head(head: bytes) -> Tuple[int, str, Dict[str, str]]:
+    """
+    Parses the given status line and headers (ending with a blank line) in one
+    pass over the bytes.
+    :param head: bytes
+    :return: tuple(int, str, dict)
+    """
+    lines = head.split(b'\r\n')
+    status_line = lines[0].split(b' ', 2)
+    if len(status_line) < 2 or not status_line[0].startswith(b'HTTP/'):
+        raise ValueError(f'Malformed status line {lines[0]!r}')
+    status = int(status_line[1])
+    reason = status_line[2].decode('latin-1') if len(status_line) > 2 else ''
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(b':')
+            headers[name.strip().lower().decode('latin-1')] = \
+                value.strip().decode('latin-1')
+    return status, reason, headers
+
+
+class Fetcher:
+    """
+    Async HTTP/1.1 fetcher with per-host pools of keep-alive connections.
+    """
+
+    def __init__(
+        self, max_connections: int = 100, max_per_host: int = 6,
+        connect_timeout: float = 10.0, read_timeout: float = 30.0,
+        keep_alive: bool = True
+    ):
+        """
+        :param max_connections: int
+        :param max_per_host: int
+        :param connect_timeout: float (in seconds)
+        :param read_timeout: float (in seconds, for each read)
+        :param keep_alive: bool
+        """
+        self._semaphore = asyncio.Semaphore(max_connections)
+        self._max_per_host = max_per_host
+        self._connect_timeout = connect_timeout
+        self._read_timeout = read_timeout
+        self._keep_alive = keep_alive
+        self._pools: Dict[Tuple[str, int, bool], HostPool] = {}
+        self.connections_opened = 0
+        self.requests = 0
+
+    async def __aenter__(self) -> 'Fetcher':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """
+        Closes all the idle connections.
+        :return: None
+        """
+        conns = []
+        for pool in self._pools.values():
+            conns.extend(pool.idle)
+            pool.idle.clear()
+        for conn in conns:
+            conn.close()
+        for conn in conns:
+            try:
+                await conn.writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def fetch(
+        self, url: str, method: str = 'GET',
+        headers: Optional[Dict[str, str]] = None
+    ) -> Response:
+        """
+        Sends a request (without body) for the given URL, and returns the
+        response, with the whole body.
+        :param url: str
+        :param method: str
+        :param headers: dict
+        :return: Response
+        """
+        async with self.stream(url, method, headers) as response:
+            body = await response.read()
+        return Response(
+            response.status, response.reason, response.headers, body
+        )
+
+    @asynccontextmanager
+    async def stream(
+        self, url: str, method: str = 'GET',
+        headers: Optional[Dict[str, str]] = None
+    ) -> AsyncIterator['StreamingResponse']:
+        """
+        Async context manager, which sends a request (without body) for the
+        given URL, and gives the response as soon as its headers are read, so
+        that the body can be streamed.
+        The connection goes back into the pool on exit if the whole body was
+        read, and is closed otherwise.
+        :param url: str
+        :param method: str
+        :param headers: dict
+        :return: async context manager of StreamingResponse
+        """
+        host_header, host, port, ssl, path = parse_url(url)
+        key = (host, port, ssl)
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = self._pools[key] = HostPool(self._max_per_host)
+        request = self._build_request(method, host_header, path, headers)
+        # Take the per-host slot first, so that waiting for a busy host does
+        # not hold a global slot
+        async with pool.semaphore, self._semaphore:
+            self.requests += 1
+            conn, response = await self._start(
+                pool, host, port, ssl, request, method
+            )
+            try:
+                yield response
+            except BaseException:
+                conn.close()
+                raise
+            if response.done and response.reusable and self._keep_alive:
+                pool.idle.append(conn)
+            else:
+                conn.close()
+
+    def _build_request(
+        self, method: str, host_header: str, path: str,
+        headers: Optional[Dict[str, str]]
+    ) -> bytes:
+        lines = [f'{method} {path} HTTP/1.1', f'Host: {host_header}']
+        if not self._keep_alive:
+            lines.append('Connection: close')
+        if headers:
+            lines.extend(f'{name}: {value}' for name, value in headers.items())
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    async def _connect(self, host: str, port: int, ssl: bool) -> Connection:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host=host, port=port, ssl=ssl or None),
+            timeout=self._connect_timeout
+        )
+        self.connections_opened += 1
+        return Connection(reader, writer)
+
+    async def _start(
+        self, pool: HostPool, host: str, port: int, ssl: bool, request: bytes,
+        method: str
+    ) -> Tuple[Connection, 'StreamingResponse']:
+        """
+        Sends the given request over an idle connection from the given pool if
+        any, or else over a new one, and reads the response headers.
+        :param pool: HostPool
+        :param host: str
+        :param port: int
+        :param ssl: bool
+        :param request: bytes
+        :param method: str
+        :return: tuple(Connection, StreamingResponse)
+        """
+        while pool.idle:
+            conn = pool.idle.pop()
+            if not conn.usable:
+                conn.close()
+                continue
+            try:
+                return conn, await self._send(conn, request, method)
+            except (asyncio.IncompleteReadError, ConnectionError) as e:
+                # The host may have closed the idle connection before
+                # receiving the request, so retry on a new connection (only if
+                # nothing was received)
+                if isinstance(e, asyncio.IncompleteReadError) and e.partial:
+                    raise
+        conn = await self._connect(host, port, ssl)
+        return conn, await self._send(conn, request, method)
+
+    async def _send(
+        self, conn: Connection, request: bytes, method: str
+    ) -> 'StreamingResponse':
+        """
+        Sends the given request over the given connection, and reads the
+        response headers.
+        :param conn: Connection
+        :param request: bytes
+        :param method: str
+        :return: StreamingResponse
+        """
+        try:
+            conn.writer.write(request)
+            await conn.writer.drain()
+            head = await with_timeout(
+                conn.reader.readuntil(b'\r\n\r\n'), self._read_timeout
+            )
+            status, reason, headers = parse_response_head(head[:-4])
+        except BaseException:
+            conn.close()
+            raise
+        return StreamingResponse(
+            conn.reader, method, status, reason, headers, self._read_timeout
+        )
+
+
+class StreamingResponse:
+    """
+    HTTP response, whose body is read from the connection on demand.
+    """
+
+    def __init__(
+        self, reader: StreamReader, method: str, status: int, reason: str,
+        headers: Dict[str, str], read_timeout: float
+    ):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self._reader = reader
+        self._read_timeout = read_timeout
+        self.reusable = headers.get('connection', '').lower() != 'close'
+        if method == 'HEAD' or status in NO_BODY_STATUSES or status < 200:
+            self._framing = 'empty'
+        elif 'chunked' in headers.get('transfer-encoding', '').lower():
+            self._framing = 'chunked'
+        elif 'content-length' in headers:
+            self._framing = 'length'
+        else:  # The body goes on until the host closes the connection
+            self._framing = 'eof'
+            self.reusable = False
+        self.done = self._framing == 'empty'  # Whether the body was all read
+
+    def __repr__(self):
+        return f'<StreamingResponse {self.status} {self.reason}>'
+
+    async def _read(self, n: int) -> bytes:
+        """
+        Reads up to the given number of bytes (at least 1, unless at EOF),
+        within the read timeout.
+        :param n: int
+        :return: bytes
+        """
+        return await with_timeout(self._reader.read(n), self._read_timeout)
+
+    async def _read_exactly(self, n: int) -> bytes:
+        return await with_timeout(
+            self._reader.readexactly(n), self._read_timeout
+        )
+
+    async def _read_line(self) -> bytes:
+        return await with_timeout(
+            self._reader.readuntil(b'\r\n'), self._read_timeout
+        )
+
+    async def iter_chunks(
+        self, chunk_size: int = 65536
+    ) -> AsyncIterator[memoryview]:
+        """
+        Async generator of the body, in chunks of up to the given size, as
+        they arrive, so that the body is never held in memory as a whole.
+        Note that the chunks do not follow the chunks of a chunked body.
+        :param chunk_size: int
+        :return: async generator of memoryview
+        """
+        if self.done:
+            return
+        if self._framing == 'length':
+            remaining = int(self.headers['content-length'])
+            while remaining:
+                data = await self._read(min(chunk_size, remaining))
+                if not data:
+                    raise asyncio.IncompleteReadError(b'', remaining)
+                remaining -= len(data)
+                yield memoryview(data)
+        elif self._framing == 'chunked':
+            while True:
+                size_line = await self._read_line()
+                remaining = int(size_line.split(b';', 1)[0], 16)
+                if not remaining:
+                    # Skip the trailers, up to the final blank line
+                    while await self._read_line() != b'\r\n':
+                        pass
+                    break
+                while remaining:
+                    data = await self._read(min(chunk_size, remaining))
+                    if not data:
+                        raise asyncio.IncompleteReadError(b'', remaining)
+                    remaining -= len(data)
+                    yield memoryview(data)
+                await self._read_exactly(2)  # The CRLF after the chunk
+        else:
+            while True:
+                data = await self._read(chunk_size)
+                if not data:
+                    break
+                yield memoryview(data)
+        self.done = True
+
+    async def read(self) -> bytes:
+        """
+        Reads the whole body.
+        :return: bytes
+        """
+        if self._framing == 'length' and not self.done:
+            body = await self._read_exactly(
+                int(self.headers['content-length'])
+            )
+            self.done = True
+            return body
+        return b''.join([chunk async for chunk in self.iter_chunks()])
+
+    async def feed(self, target: Generator, chunk_size: int = 65536) -> None:
+        """
+        Sends the chunks of the body to the given (primed) coroutine, like a
+        source in a coroutine pipeline, and closes it at the end.
+        Note that the chunks are only valid during the send() calls.
+        :param target: coroutine
+        :param chunk_size: int
+        :return: None
+        """
+        async for chunk in self.iter_chunks(chunk_size):
+            target.send(chunk)
+        target.close()
+
+
+@coroutine
+def split_lines(target: Coroutine, encoding: str = 'utf-8'):
+    """
+    A coroutine that receives chunks of bytes, and sends the complete lines in
+    them to the given target, decoded and with their line ending, like the
+    lines read from a text file, so that the stages of copipe.py can be used
+    on them.
+    A partial line is held on to until its end arrives.
+    :param target: coroutine
+    :param encoding: str
+    :return: coroutine
+    """
+    partial = b''
+    try:
+        while True:
+            chunk = yield
+            lines = (partial + chunk).split(b'\n')
+            partial = lines.pop()
+            for line in lines:
+                target.send(line.decode(encoding) + '\n')
+    except GeneratorExit:
+        if partial:
+            target.send(partial.decode(encoding))
+        target.close()
+
+
+async def main():
+    server, server_stats = await start_local_server()
+    host, port = server.sockets[0].getsockname()[:2]
+    base_url = f'http://{host}:{port}'
+    async with server, Fetcher(max_per_host=4, read_timeout=0.5) as fetcher:
+        response = await fetcher.fetch(f'{base_url}/')
+        print(response, response.body)
+        # Requests beyond the per-host cap wait for a free slot, and reuse the
+        # connections kept alive
+        paths = [f'/bytes/{n}' for n in range(0, 20000, 1000)]
+        responses = await asyncio.gather(
+            *[fetcher.fetch(base_url + path) for path in paths]
+        )
+        assert [len(response.body) for response in responses] == \
+            list(range(0, 20000, 1000))
+        print(
+            f'{fetcher.requests} requests over '
+            f'{fetcher.connections_opened} connections '
+            f'(the server saw {server_stats.connections})'
+        )
+        try:
+            await fetcher.fetch(f'{base_url}/delay/1')
+        except asyncio.TimeoutError:
+            print('/delay/1 timed out')
+        # Stream a chunked body of about 2MB through a pipeline, in chunks of
+        # up to 16KB
+        async with fetcher.stream(f'{base_url}/lines/200000') as response:
+            pipeline = split_lines(
+                target=grep(pattern='99999', target=printer())
+            )
+            await response.feed(pipeline, chunk_size=16384)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
+
+
+# Output:
+# <Response 200 OK (14 bytes)> b'Hello, world!\n'
+# 21 requests over 4 connections (the server saw 4)
+# /delay/1 timed out
+# line 99999
+# line 199999
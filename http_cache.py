@@ -0,0 +1,338 @@
+#!usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+An HTTP response cache for the fetcher of async_fetcher.py, so that polling the
+same URLs does not fetch the same bodies over and over again.
+
+The responses are kept in two size-bounded LRU tiers: in memory, and on disk
+(one file per response), where they survive restarts.
+A file on disk holds a line of JSON with the key, the status line, the headers
+and the time the response was stored, followed by the raw body, so that
+nothing read from the cache directory is ever executed (unlike with pickle).
+A cached response is served as is while it is fresh ("Cache-Control: max-age");
+once it is stale, or if it must always be revalidated ("Cache-Control:
+no-cache"), it is revalidated with a conditional request ("If-None-Match" with
+its "ETag", or "If-Modified-Since" with its "Last-Modified"), so that an
+unchanged body comes back as a cheap "304 Not Modified".
+Responses with "Cache-Control: no-store" are never cached.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from async_fetcher import Fetcher, Response
+from local_http_server import start_local_server
+
+BODY_HEADERS = {'content-length', 'transfer-encoding', 'content-encoding'}
+
+
+class CacheEntry:
+    """
+    Cached response, with the time it was stored (or last revalidated).
+    """
+
+    def __init__(self, response: Response, stored_at: float):
+        self.response = response
+        self.stored_at = stored_at
+
+    @property
+    def size(self) -> int:
+        return len(self.response.body) + sum(
+            len(name) + len(value)
+            for name, value in self.response.headers.items()
+        )
+
+
+def cache_control(headers: Dict[str, str]) -> Dict[str, Optional[str]]:
+    """
+    Parses the "Cache-Control" header in the given headers into its
+    directives.
+    :param headers: dict
+    :return: dict
+    """
+    directives = {}
+    for directive in headers.get('cache-control', '').split(','):
+        name, _, value = directive.strip().partition('=')
+        if name:
+            directives[name.lower()] = value.strip('"') or None
+    return directives
+
+
+class HTTPCache:
+    """
+    Two-tier LRU cache of responses, in memory and (optionally) on disk.
+    """
+
+    def __init__(
+        self, directory: Optional[str] = None,
+        max_memory_bytes: int = 16 << 20, max_disk_bytes: int = 256 << 20
+    ):
+        """
+        :param directory: str
+        :param max_memory_bytes: int
+        :param max_disk_bytes: int
+        """
+        self._memory: Dict[str, CacheEntry] = OrderedDict()
+        self._memory_bytes = 0
+        self._max_memory_bytes = max_memory_bytes
+        self._directory = directory
+        # File sizes of the entries on disk, in LRU order
+        self._disk: Dict[str, int] = OrderedDict()
+        self._disk_bytes = 0
+        self._max_disk_bytes = max_disk_bytes
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            filenames = sorted(
+                os.listdir(directory),
+                key=lambda filename: os.path.getmtime(
+                    os.path.join(directory, filename)
+                )
+            )
+            for filename in filenames:
+                if filename.endswith('.cache'):
+                    size = os.path.getsize(os.path.join(directory, filename))
+                    self._disk[filename] = size
+                    self._disk_bytes += size
+
+    @staticmethod
+    def _filename(key: str) -> str:
+        return hashlib.sha1(key.encode('utf-8')).hexdigest() + '.cache'
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        """
+        Returns the entry with the given key from memory, or else from disk
+        (which also brings it into memory).
+        The disk is read in the default executor, so that it does not block the
+        event loop.
+        :param key: str
+        :return: CacheEntry or None
+        """
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+            return entry
+        filename = self._filename(key)
+        if filename not in self._disk:
+            return None
+        loop = asyncio.get_running_loop()
+        try:
+            stored_key, entry = await loop.run_in_executor(
+                None, self._read_file, filename
+            )
+        except (OSError, ValueError, KeyError, TypeError):  # Corrupt file
+            await self._remove_from_disk([filename])
+            return None
+        if stored_key != key:  # A hash collision
+            return None
+        if filename in self._disk:  # Not evicted in the meantime
+            self._disk.move_to_end(filename)
+        self._put_in_memory(key, entry)
+        return entry
+
+    async def put(self, key: str, entry: CacheEntry) -> None:
+        """
+        Stores the given entry with the given key, in memory and on disk.
+        The disk is written in the default executor, so that it does not block
+        the event loop.
+        :param key: str
+        :param entry: CacheEntry
+        :return: None
+        """
+        self._put_in_memory(key, entry)
+        if self._directory is None:
+            return
+        filename = self._filename(key)
+        # Encode right away, so that the entry written is the one given, even
+        # if it is updated while being written
+        data = self._encode(key, entry)
+        await asyncio.get_running_loop().run_in_executor(
+            None, self._write_file, filename, data
+        )
+        self._disk_bytes -= self._disk.pop(filename, 0)
+        self._disk[filename] = len(data)
+        self._disk_bytes += len(data)
+        evicted = []
+        while self._disk_bytes > self._max_disk_bytes and len(self._disk) > 1:
+            evicted_filename, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            evicted.append(evicted_filename)
+        if evicted:
+            await self._remove_from_disk(evicted)
+
+    def _put_in_memory(self, key: str, entry: CacheEntry) -> None:
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= old.size
+        if entry.size > self._max_memory_bytes:  # Only kept on disk
+            return
+        self._memory[key] = entry
+        self._memory_bytes += entry.size
+        while self._memory_bytes > self._max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.size
+
+    @staticmethod
+    def _encode(key: str, entry: CacheEntry) -> bytes:
+        response = entry.response
+        metadata = json.dumps({
+            'key': key,
+            'status': response.status,
+            'reason': response.reason,
+            'headers': response.headers,
+            'stored_at': entry.stored_at,
+        })
+        # The JSON has no newline, as the ones in strings are escaped
+        return metadata.encode('utf-8') + b'\n' + response.body
+
+    @staticmethod
+    def _decode(data: bytes) -> tuple:
+        metadata, _, body = data.partition(b'\n')
+        metadata = json.loads(metadata)
+        response = Response(
+            int(metadata['status']), str(metadata['reason']),
+            {
+                str(name): str(value)
+                for name, value in metadata['headers'].items()
+            },
+            body
+        )
+        return metadata['key'], CacheEntry(
+            response, float(metadata['stored_at'])
+        )
+
+    def _read_file(self, filename: str) -> tuple:
+        with open(os.path.join(self._directory, filename), 'rb') as f:
+            return self._decode(f.read())
+
+    def _write_file(self, filename: str, data: bytes) -> None:
+        # Write to a temporary file first, so that a crash never leaves a
+        # truncated entry behind
+        fd, tmp_path = tempfile.mkstemp(dir=self._directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, os.path.join(self._directory, filename))
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+    async def _remove_from_disk(self, filenames: List[str]) -> None:
+        for filename in filenames:
+            self._disk_bytes -= self._disk.pop(filename, 0)
+        await asyncio.get_running_loop().run_in_executor(
+            None, self._remove_files, filenames
+        )
+
+    def _remove_files(self, filenames: List[str]) -> None:
+        for filename in filenames:
+            try:
+                os.remove(os.path.join(self._directory, filename))
+            except FileNotFoundError:
+                pass
+
+
+class CachingFetcher:
+    """
+    Wrapper of a Fetcher, which serves GET requests from the given cache when
+    possible.
+    """
+
+    def __init__(self, fetcher: Fetcher, cache: HTTPCache):
+        self._fetcher = fetcher
+        self._cache = cache
+        self.hits = 0  # Served from the cache without any request
+        self.revalidations = 0  # Served from the cache after a 304
+        self.misses = 0
+
+    async def fetch(self, url: str) -> Response:
+        """
+        Returns the response for the given URL, from the cache if possible.
+        :param url: str
+        :return: Response
+        """
+        entry = await self._cache.get(url)
+        headers = {}
+        if entry is not None:
+            cached = entry.response
+            directives = cache_control(cached.headers)
+            max_age = directives.get('max-age')
+            if 'no-cache' not in directives and max_age is not None and \
+                    max_age.isdigit() and \
+                    time.time() - entry.stored_at < int(max_age):
+                self.hits += 1
+                return cached
+            if 'etag' in cached.headers:
+                headers['If-None-Match'] = cached.headers['etag']
+            if 'last-modified' in cached.headers:
+                headers['If-Modified-Since'] = cached.headers['last-modified']
+        response = await self._fetcher.fetch(url, headers=headers)
+        if response.status == 304 and entry is not None:
+            self.revalidations += 1
+            # The 304 may update the headers (e.g., a new "Cache-Control"),
+            # but not the ones describing the cached body.
+            # A new response is built, as the cached one may be held by the
+            # callers it was returned to before
+            headers = dict(cached.headers)
+            headers.update(
+                (name, value) for name, value in response.headers.items()
+                if name not in BODY_HEADERS
+            )
+            revalidated = Response(
+                cached.status, cached.reason, headers, cached.body
+            )
+            await self._cache.put(url, CacheEntry(revalidated, time.time()))
+            return revalidated
+        self.misses += 1
+        directives = cache_control(response.headers)
+        if response.status == 200 and 'no-store' not in directives and (
+            'max-age' in directives or 'etag' in response.headers or
+            'last-modified' in response.headers
+        ):
+            await self._cache.put(url, CacheEntry(response, time.time()))
+        return response
+
+
+async def main():
+    server, server_stats = await start_local_server()
+    host, port = server.sockets[0].getsockname()[:2]
+    base_url = f'http://{host}:{port}'
+    with tempfile.TemporaryDirectory() as directory:
+        async with server, Fetcher() as fetcher:
+            caching_fetcher = CachingFetcher(fetcher, HTTPCache(directory))
+            for _ in range(3):
+                # "/" can only be revalidated, while "/cache/60" stays fresh
+                # for 60 seconds
+                await caching_fetcher.fetch(f'{base_url}/')
+                await caching_fetcher.fetch(f'{base_url}/cache/60')
+            print(
+                f'hits: {caching_fetcher.hits}, '
+                f'revalidations: {caching_fetcher.revalidations}, '
+                f'misses: {caching_fetcher.misses} '
+                f'({server_stats.requests} requests to the server)'
+            )
+            # A new cache on the same directory, like after a restart
+            caching_fetcher = CachingFetcher(fetcher, HTTPCache(directory))
+            response = await caching_fetcher.fetch(f'{base_url}/cache/60')
+            print(
+                f'After a restart: {response.body}, '
+                f'hits: {caching_fetcher.hits}'
+            )
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
+
+
+# Output:
+# hits: 2, revalidations: 2, misses: 2 (4 requests to the server)
+# After a restart: b'Cache me if you can\n', hits: 1
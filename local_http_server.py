@@ -0,0 +1,169 @@
+#!usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+A minimal local HTTP/1.1 server with asyncio.start_server(), which stands in
+for the real hosts in the demos and benchmarks of async_fetcher.py, so that
+they do not depend on the network.
+
+It keeps the connections alive (unless asked otherwise), and serves:
+- "/": A short greeting
+- "/bytes/<n>": n bytes of data
+- "/delay/<seconds>": A short body, after the given delay
+- "/cache/<seconds>": A short body, which can be cached for the given time
+- "/lines/<n>": n numbered lines, with chunked transfer-encoding
+Every body comes with an "ETag" and a "Last-Modified" header, and a conditional
+request ("If-None-Match" or "If-Modified-Since") for an unchanged body gets a
+"304 Not Modified" response.
+"""
+
+import asyncio
+import hashlib
+import time
+from asyncio import StreamReader, StreamWriter
+from email.utils import formatdate
+from typing import Dict, Tuple
+
+REASONS = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found'}
+CHUNK_SIZE = 4096  # For chunked transfer-encoding
+# The bodies never change while the server is running
+LAST_MODIFIED = formatdate(time.time(), usegmt=True)
+
+
+class ServerStats:
+    """
+    Counters of the local server.
+    """
+
+    def __init__(self):
+        self.connections = 0
+        self.requests = 0
+
+
+def parse_request_head(head: bytes) -> Tuple[str, str, str, Dict[str, str]]:
+    """
+    Parses the given request line and headers (ending with a blank line).
+    :param head: bytes
+    :return: tuple(str, str, str, dict)
+    """
+    lines = head.decode('latin-1').split('\r\n')
+    method, target, version = lines[0].split(' ', 2)
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+    return method, target, version, headers
+
+
+async def respond(
+    method: str, path: str, headers: Dict[str, str]
+) -> Tuple[int, Dict[str, str], bytes]:
+    """
+    Returns the status, the headers and the body of the response to the given
+    request.
+    :param method: str
+    :param path: str
+    :param headers: dict
+    :return: tuple(int, dict, bytes)
+    """
+    parts = path.strip('/').split('/')
+    if path == '/':
+        body = b'Hello, world!\n'
+    elif len(parts) == 2 and parts[0] == 'bytes' and parts[1].isdigit():
+        body = b'x' * int(parts[1])
+    elif len(parts) == 2 and parts[0] == 'delay':
+        await asyncio.sleep(float(parts[1]))
+        body = b'Sorry for the wait\n'
+    elif len(parts) == 2 and parts[0] == 'cache' and parts[1].isdigit():
+        body = b'Cache me if you can\n'
+    elif len(parts) == 2 and parts[0] == 'lines' and parts[1].isdigit():
+        body = b''.join(b'line %d\n' % i for i in range(int(parts[1])))
+    else:
+        return 404, {}, b'Not found\n'
+    etag = f'"{hashlib.md5(body).hexdigest()}"'
+    resp_headers = {'ETag': etag, 'Last-Modified': LAST_MODIFIED}
+    if parts[0] == 'cache':
+        resp_headers['Cache-Control'] = f'max-age={parts[1]}'
+    if 'if-none-match' in headers:
+        if etag in [tag.strip() for tag in headers['if-none-match'].split(',')]:
+            return 304, resp_headers, b''
+    elif headers.get('if-modified-since') == LAST_MODIFIED:
+        return 304, resp_headers, b''
+    resp_headers['Content-Type'] = 'text/plain'
+    if parts[0] == 'lines':
+        resp_headers['Transfer-Encoding'] = 'chunked'
+    return 200, resp_headers, body
+
+
+async def start_local_server(
+    host: str = '127.0.0.1', port: int = 0
+) -> Tuple[asyncio.AbstractServer, ServerStats]:
+    """
+    Starts the local server on the given port (any free one if 0), and returns
+    the server (whose address is in server.sockets[0].getsockname()) and its
+    counters.
+    :param host: str
+    :param port: int
+    :return: tuple(AbstractServer, ServerStats)
+    """
+    stats = ServerStats()
+
+    async def handle_client(reader: StreamReader, writer: StreamWriter):
+        stats.connections += 1
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break  # The client closed the connection
+                try:
+                    method, target, version, headers = \
+                        parse_request_head(head)
+                except ValueError:
+                    writer.write(b'HTTP/1.1 400 Bad Request\r\n'
+                                 b'Content-Length: 0\r\n'
+                                 b'Connection: close\r\n\r\n')
+                    break
+                if 'content-length' in headers:  # Ignore the request body
+                    await reader.readexactly(int(headers['content-length']))
+                stats.requests += 1
+                status, resp_headers, body = await respond(
+                    method, target, headers
+                )
+                keep_alive = version == 'HTTP/1.1' and \
+                    headers.get('connection', '').lower() != 'close'
+                chunked = resp_headers.get('Transfer-Encoding') == 'chunked'
+                if status != 304 and not chunked:
+                    resp_headers['Content-Length'] = str(len(body))
+                if not keep_alive:
+                    resp_headers['Connection'] = 'close'
+                lines = [f'HTTP/1.1 {status} {REASONS.get(status, "")}']
+                lines.extend(
+                    f'{name}: {value}' for name, value in resp_headers.items()
+                )
+                writer.write(
+                    ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+                )
+                if method == 'HEAD':
+                    pass
+                elif chunked:
+                    for i in range(0, len(body), CHUNK_SIZE):
+                        chunk = body[i:i + CHUNK_SIZE]
+                        writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+                        await writer.drain()
+                    writer.write(b'0\r\n\r\n')
+                else:
+                    writer.write(body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.CancelledError):
+            # Also let the event loop cancel a pending request on shutdown
+            # without complaining
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle_client, host, port)
+    return server, stats
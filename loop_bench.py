@@ -0,0 +1,119 @@
+#!usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+A benchmark suite of event loop implementations, run with loop_runner.py on
+each loop available here, in operations per second:
+- spawn: Creating and awaiting tasks which do nothing
+- sleep(0) ping-pong: Tasks taking turns with asyncio.sleep(0)
+- queue: Zero-length jobs passed from a producer to the 3 workers of
+  comm_via_queue.py via its (FIFO) SchedulingQueue
+- TCP echo: Round trips of small messages with a local echo server
+"""
+
+import asyncio
+import time
+from typing import Callable, Dict
+
+from comm_via_queue import Job, SchedulingQueue, worker_coro
+from loop_runner import available_loops, run
+
+N_TASKS = 100_000
+N_SWITCHES = 200_000
+N_ITEMS = 200_000
+N_ROUND_TRIPS = 20_000
+
+
+async def bench_spawn() -> float:
+    async def nothing() -> None:
+        pass
+
+    started_at = time.perf_counter()
+    await asyncio.gather(
+        *[asyncio.create_task(nothing()) for _ in range(N_TASKS)]
+    )
+    return N_TASKS / (time.perf_counter() - started_at)
+
+
+async def bench_ping_pong() -> float:
+    async def player(n: int) -> None:
+        for _ in range(n):
+            await asyncio.sleep(0)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(player(N_SWITCHES // 2), player(N_SWITCHES // 2))
+    return N_SWITCHES / (time.perf_counter() - started_at)
+
+
+async def bench_queue() -> float:
+    q = SchedulingQueue(maxsize=1000)
+    workers = [
+        asyncio.create_task(worker_coro(f'Worker-{i}', q, verbose=False))
+        for i in range(3)
+    ]
+    job = Job(sleep_for=0.0, deadline=0.0)
+    started_at = time.perf_counter()
+    for _ in range(N_ITEMS):
+        await q.put(job)
+    await q.join()
+    elapsed = time.perf_counter() - started_at
+    for task in workers:
+        task.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+    return N_ITEMS / elapsed
+
+
+async def bench_tcp_echo() -> float:
+    async def echo(reader, writer) -> None:
+        while True:
+            data = await reader.read(4096)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(echo, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    async with server:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        message = b'x' * 64
+        started_at = time.perf_counter()
+        for _ in range(N_ROUND_TRIPS):
+            writer.write(message)
+            await reader.readexactly(len(message))
+        elapsed = time.perf_counter() - started_at
+        writer.close()
+        await writer.wait_closed()
+    return N_ROUND_TRIPS / elapsed
+
+
+BENCHMARKS: Dict[str, Callable] = {
+    'spawn (tasks/sec)': bench_spawn,
+    'sleep(0) ping-pong (switches/sec)': bench_ping_pong,
+    'queue (items/sec)': bench_queue,
+    'TCP echo (round trips/sec)': bench_tcp_echo,
+}
+
+
+def main():
+    loops = available_loops()
+    if 'uvloop' not in loops:
+        print('(uvloop is not installed, so only the default loop is run)')
+    print(f'{"benchmark":<36}' + ''.join(f'{loop:>14}' for loop in loops))
+    for label, bench in BENCHMARKS.items():
+        rates = [run(bench(), loop=loop) for loop in loops]
+        print(f'{label:<36}' + ''.join(f'{rate:>14,.0f}' for rate in rates))
+
+
+if __name__ == '__main__':
+    main()
+
+
+# Output (on a single core, without uvloop installed):
+# (uvloop is not installed, so only the default loop is run)
+# benchmark                                  asyncio
+# spawn (tasks/sec)                          145,383
+# sleep(0) ping-pong (switches/sec)          507,174
+# queue (items/sec)                          179,539
+# TCP echo (round trips/sec)                  47,478
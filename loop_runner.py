@@ -0,0 +1,102 @@
+#!usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+A single entry point to run a coroutine on a chosen event loop implementation,
+instead of the legacy asyncio.get_event_loop() in yield_from_and_asyncio.py, or
+asyncio.run() in async_and_await.py, which can only use the default one.
+
+The loop can be:
+- "asyncio": The default loop of the standard library (the selector loop on
+  Unix)
+- "uvloop": The loop of uvloop (which must be installed)
+- "auto": uvloop if it is installed, otherwise the default loop
+The default choice can also be set with the environment variable ASYNC_LOOP.
+"""
+
+import asyncio
+import os
+from typing import Callable, Coroutine, List, Optional
+
+LOOPS = ('auto', 'asyncio', 'uvloop')
+
+
+def loop_factory(loop: Optional[str] = None) -> Callable:
+    """
+    Returns the function creating a new event loop of the given
+    implementation.
+    :param loop: str
+    :return: callable
+    """
+    if loop is None:
+        loop = os.environ.get('ASYNC_LOOP', 'auto')
+    if loop not in LOOPS:
+        raise ValueError(f'Unknown loop {loop!r}, expected one of {LOOPS}')
+    if loop in ('auto', 'uvloop'):
+        try:
+            import uvloop
+            return uvloop.new_event_loop
+        except ImportError:
+            if loop == 'uvloop':
+                raise
+    return asyncio.new_event_loop
+
+
+def available_loops() -> List[str]:
+    """
+    Returns the loop implementations which can be used here.
+    :return: list[str]
+    """
+    loops = ['asyncio']
+    try:
+        import uvloop  # noqa: F401
+        loops.append('uvloop')
+    except ImportError:
+        pass
+    return loops
+
+
+def run(coro: Coroutine, loop: Optional[str] = None):
+    """
+    Runs the given coroutine on a new event loop of the given implementation,
+    like asyncio.run(), and returns its result.
+    :param coro: coroutine
+    :param loop: str
+    :return: object
+    """
+    try:
+        factory = loop_factory(loop)
+    except (ValueError, ImportError):
+        coro.close()  # Never to be awaited
+        raise
+    if hasattr(asyncio, 'Runner'):  # From Python 3.11
+        with asyncio.Runner(loop_factory=factory) as runner:
+            return runner.run(coro)
+    # Before Python 3.11, asyncio.run() can only pick the loop via the policy
+    policy = asyncio.get_event_loop_policy()
+    if factory is not asyncio.new_event_loop:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    try:
+        return asyncio.run(coro)
+    finally:
+        asyncio.set_event_loop_policy(policy)
+
+
+async def which_loop() -> str:
+    return type(asyncio.get_running_loop()).__name__
+
+
+if __name__ == '__main__':
+    print(f'auto: {run(which_loop())}')
+    print(f'asyncio: {run(which_loop(), loop="asyncio")}')
+    try:
+        print(f'uvloop: {run(which_loop(), loop="uvloop")}')
+    except ImportError:
+        print('uvloop: (not installed)')
+
+
+# Output (without uvloop installed):
+# auto: _UnixSelectorEventLoop
+# asyncio: _UnixSelectorEventLoop
+# uvloop: (not installed)
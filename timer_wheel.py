@@ -0,0 +1,300 @@
+#!usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+A hierarchical timer wheel for asyncio, as a replacement of asyncio.sleep() and
+loop.call_later() for huge numbers of timers.
+
+Every asyncio.sleep() puts a timer into the heap of the event loop, so that
+each timer costs O(log n) to schedule, which adds up with about a million
+sleepers. The timer wheel instead rounds the expiry times up to ticks of a
+coarse resolution (10ms by default), and puts each timer into the slot of its
+tick in one of several wheels, in O(1):
+- The first wheel has one slot per tick, for the next 256 ticks.
+- Each next wheel has one slot per 256 slots of the previous one, so 4 wheels
+  cover 256^4 ticks (about 497 days at 10ms).
+When the first wheel goes round, the timers in the next slot of the next wheel
+are cascaded down into the first wheel, and so on.
+The wheel only puts a single timer into the event loop, for the next tick with
+timers due in the first wheel (or the next cascade, at the latest), and only
+while it has timers, so that sparse or long sleeps do not wake the loop up on
+every tick.
+
+Note that the timers fire up to one tick late, which is the price of the
+O(1) scheduling.
+"""
+
+import asyncio
+import weakref
+from typing import Callable, List, Optional
+
+WHEEL_BITS = 8
+WHEEL_SIZE = 1 << WHEEL_BITS
+WHEEL_MASK = WHEEL_SIZE - 1
+N_WHEELS = 4
+
+
+class WheelTimer:
+    """
+    Timer in a timer wheel, which can be cancelled like an asyncio.TimerHandle.
+    """
+    __slots__ = ('tick', 'callback', 'args', 'cancelled', 'wheel')
+
+    def __init__(
+        self, tick: int, callback: Callable, args: tuple, wheel: 'TimerWheel'
+    ):
+        self.tick = tick
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+        self.wheel = wheel  # None once fired or cancelled
+
+    def cancel(self) -> None:
+        # The timer is only dropped from its slot when the slot is processed
+        # (or when the wheel runs out of timers)
+        self.cancelled = True
+        self.callback = self.args = None
+        if self.wheel is not None:
+            self.wheel._on_cancel()
+            self.wheel = None
+
+
+class TimerWheel:
+    """
+    Hierarchical timer wheel driven by an asyncio event loop.
+    """
+
+    def __init__(
+        self, loop: Optional[asyncio.AbstractEventLoop] = None,
+        resolution: float = 0.01
+    ):
+        """
+        :param loop: AbstractEventLoop
+        :param resolution: float (in seconds)
+        """
+        self._loop = loop or asyncio.get_running_loop()
+        self._resolution = resolution
+        self._origin = self._loop.time()
+        self._wheels: List[List[list]] = [
+            [[] for _ in range(WHEEL_SIZE)] for _ in range(N_WHEELS)
+        ]
+        self._tick = 0  # The last processed tick
+        self._n_timers = 0  # Excluding the cancelled ones
+        self._n_cancelled = 0  # The cancelled ones not dropped yet
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._wake_tick = 0  # The tick of the handle
+
+    def __len__(self) -> int:
+        return self._n_timers
+
+    def call_later(
+        self, delay: float, callback: Callable, *args
+    ) -> WheelTimer:
+        """
+        Schedules the given callback to be called with the given arguments
+        after the given delay (in seconds), rounded up to the next tick.
+        :param delay: float
+        :param callback: callable
+        :param args: tuple
+        :return: WheelTimer
+        """
+        if not self._n_timers:
+            # Skip the ticks elapsed while the wheel was empty
+            self._tick = self._current_tick()
+        # Round up, so that a timer never fires early
+        tick = -int(-(self._loop.time() + delay - self._origin) //
+                    self._resolution)
+        timer = WheelTimer(max(tick, self._tick + 1), callback, args, self)
+        self._insert(timer)
+        self._n_timers += 1
+        if self._handle is None or timer.tick < self._wake_tick:
+            if self._handle is not None:
+                self._handle.cancel()
+            self._schedule_at(timer.tick)
+        return timer
+
+    def _on_cancel(self) -> None:
+        self._n_timers -= 1
+        self._n_cancelled += 1
+        if not self._n_timers:
+            if self._handle is not None:
+                self._handle.cancel()
+                self._handle = None
+            self._sweep()
+
+    def _sweep(self) -> None:
+        """
+        Drops the cancelled timers left in the slots, once the wheel has no
+        other timers.
+        :return: None
+        """
+        for wheel in self._wheels:
+            for index, slot in enumerate(wheel):
+                if slot:
+                    wheel[index] = []
+        self._n_cancelled = 0
+
+    def _current_tick(self) -> int:
+        return int((self._loop.time() - self._origin) // self._resolution)
+
+    def _insert(self, timer: WheelTimer) -> None:
+        """
+        Puts the given timer into the slot of its tick, in the first wheel
+        which reaches that far.
+        :param timer: WheelTimer
+        :return: None
+        """
+        delta = timer.tick - self._tick
+        for level in range(N_WHEELS):
+            if delta < 1 << (WHEEL_BITS * (level + 1)) or \
+                    level == N_WHEELS - 1:
+                # Beyond the last wheel, the timer just goes round again
+                index = (timer.tick >> (WHEEL_BITS * level)) & WHEEL_MASK
+                self._wheels[level][index].append(timer)
+                return
+
+    def _next_tick(self) -> int:
+        """
+        Returns the next tick with timers in the first wheel, up to the next
+        cascade, when the first wheel goes round.
+        :return: int
+        """
+        first_wheel = self._wheels[0]
+        cascade_tick = (self._tick | WHEEL_MASK) + 1
+        for tick in range(self._tick + 1, cascade_tick):
+            if first_wheel[tick & WHEEL_MASK]:
+                return tick
+        return cascade_tick
+
+    def _schedule_at(self, tick: int) -> None:
+        self._wake_tick = tick
+        self._handle = self._loop.call_at(
+            self._origin + tick * self._resolution, self._on_tick
+        )
+
+    def _on_tick(self) -> None:
+        """
+        Processes all the ticks up to now, firing the timers which are due.
+        :return: None
+        """
+        self._handle = None
+        # The loop may call back a bit early, or the time may round down to the
+        # previous tick, which must not make the wheel wait for the same tick
+        # again
+        now_tick = max(self._current_tick(), self._wake_tick)
+        wheels = self._wheels
+        while self._tick < now_tick and self._n_timers:
+            tick = self._tick = self._tick + 1
+            # Cascade the timers of the next slot of each wheel which goes
+            # round, from the outermost one
+            for level in range(N_WHEELS - 1, 0, -1):
+                if tick & ((1 << (WHEEL_BITS * level)) - 1) == 0:
+                    index = (tick >> (WHEEL_BITS * level)) & WHEEL_MASK
+                    slot = wheels[level][index]
+                    wheels[level][index] = []
+                    for timer in slot:
+                        if timer.cancelled:
+                            self._n_cancelled -= 1
+                        else:
+                            self._insert(timer)
+            index = tick & WHEEL_MASK
+            slot = wheels[0][index]
+            if not slot:
+                continue
+            wheels[0][index] = []
+            for timer in slot:
+                if timer.cancelled:
+                    self._n_cancelled -= 1
+                elif timer.tick > tick:  # Not due until a later round
+                    self._insert(timer)
+                else:
+                    self._n_timers -= 1
+                    timer.wheel = None
+                    try:
+                        timer.callback(*timer.args)
+                    except Exception as e:
+                        self._loop.call_exception_handler({
+                            'message': 'Exception in timer wheel callback',
+                            'exception': e,
+                        })
+        if self._handle is not None:
+            # A callback scheduled a new timer in the meantime
+            self._handle.cancel()
+            self._handle = None
+        if self._n_timers:
+            self._schedule_at(self._next_tick())
+        elif self._n_cancelled:
+            self._sweep()
+
+
+_wheels = weakref.WeakKeyDictionary()
+
+
+def get_wheel() -> TimerWheel:
+    """
+    Returns the timer wheel of the running event loop, creating it if needed.
+    :return: TimerWheel
+    """
+    loop = asyncio.get_running_loop()
+    wheel = _wheels.get(loop)
+    if wheel is None:
+        wheel = _wheels[loop] = TimerWheel(loop)
+    return wheel
+
+
+def call_later(delay: float, callback: Callable, *args) -> WheelTimer:
+    """
+    Like loop.call_later(), on the timer wheel of the running event loop.
+    :param delay: float
+    :param callback: callable
+    :param args: tuple
+    :return: WheelTimer
+    """
+    return get_wheel().call_later(delay, callback, *args)
+
+
+def _wake_up(future: asyncio.Future, result) -> None:
+    if not future.done():
+        future.set_result(result)
+
+
+async def sleep(delay: float, result=None):
+    """
+    Like asyncio.sleep(), on the timer wheel of the running event loop.
+    :param delay: float
+    :param result: object
+    :return: object
+    """
+    if delay <= 0:
+        await asyncio.sleep(0)
+        return result
+    future = asyncio.get_running_loop().create_future()
+    timer = get_wheel().call_later(delay, _wake_up, future, result)
+    try:
+        return await future
+    finally:
+        timer.cancel()
+
+
+async def main():
+    loop = asyncio.get_running_loop()
+
+    async def sleeper(i: int, delay: float) -> None:
+        started_at = loop.time()
+        await sleep(delay)
+        print(f'Sleeper-{i} slept for {loop.time() - started_at:.2f} seconds')
+
+    await asyncio.gather(*[
+        sleeper(i, delay) for i, delay in enumerate([0.5, 0.1, 3.0, 1.2])
+    ])
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
+
+
+# Output:
+# Sleeper-1 slept for 0.10 seconds
+# Sleeper-0 slept for 0.51 seconds
+# Sleeper-3 slept for 1.21 seconds
+# Sleeper-2 slept for 3.01 seconds
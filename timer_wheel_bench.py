@@ -0,0 +1,118 @@
+#!usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+A benchmark comparing the timer wheel of timer_wheel.py against the timer heap
+of the asyncio event loop, with 10k, 100k and 1M timers due at random within
+1 to 2 seconds, in:
+- the cost of scheduling a timer
+- the memory taken by the scheduled timers
+- how late the timers fire (the mean and the 99th percentile), which includes
+  the time spent running the callbacks of the timers due before
+"""
+
+import asyncio
+import random
+import time
+import tracemalloc
+from typing import Callable, List
+
+from timer_wheel import TimerWheel
+
+
+def schedule(
+    kind: str, loop: asyncio.AbstractEventLoop, delays: List[float],
+    callback: Callable
+) -> list:
+    """
+    Schedules a timer after each of the given delays with the given kind of
+    timers, and returns the timers.
+    :param kind: str
+    :param loop: AbstractEventLoop
+    :param delays: list[float]
+    :param callback: callable
+    :return: list
+    """
+    if kind == 'heap':
+        call_later = loop.call_later
+    else:
+        call_later = TimerWheel(loop).call_later
+    now = loop.time()
+    return [call_later(delay, callback, now + delay) for delay in delays]
+
+
+async def measure_time(kind: str, delays: List[float]) -> None:
+    """
+    Prints the scheduling cost, and how late the timers fire.
+    :param kind: str
+    :param delays: list[float]
+    :return: None
+    """
+    loop = asyncio.get_running_loop()
+    lates = []
+    done = loop.create_future()
+
+    def callback(deadline: float) -> None:
+        lates.append(loop.time() - deadline)
+        if len(lates) == len(delays):
+            done.set_result(None)
+
+    started_at = time.perf_counter()
+    schedule(kind, loop, delays, callback)
+    elapsed = time.perf_counter() - started_at
+    await done
+    lates.sort()
+    print(
+        f'{kind:<6} {len(delays):>9,} timers '
+        f'{elapsed / len(delays) * 1e9:>7,.0f} ns/timer  late by '
+        f'{sum(lates) / len(lates) * 1e3:>7.1f} ms (mean) '
+        f'{lates[int(len(lates) * 0.99)] * 1e3:>7.1f} ms (p99)',
+        end=''
+    )
+
+
+async def measure_memory(kind: str, delays: List[float]) -> None:
+    """
+    Prints the memory taken by the scheduled timers.
+    :param kind: str
+    :param delays: list[float]
+    :return: None
+    """
+    loop = asyncio.get_running_loop()
+    tracemalloc.start()
+    timers = schedule(kind, loop, delays, print)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # Leave out the list of the timers, which is only kept for cancelling them
+    size -= timers.__sizeof__()
+    print(f'  {size / len(delays):>5.0f} B/timer')
+    for timer in timers:
+        timer.cancel()
+
+
+def main():
+    for n in [10_000, 100_000, 1_000_000]:
+        delays = [random.uniform(1.0, 2.0) for _ in range(n)]
+        for kind in ['heap', 'wheel']:
+            asyncio.run(measure_time(kind, delays))
+            asyncio.run(measure_memory(kind, delays))
+
+
+if __name__ == '__main__':
+    main()
+
+
+# Output (on a single core):
+# heap      10,000 timers   4,347 ns/timer  late by    22.1 ms (mean)    45.1 ms (p99)    269 B/timer
+# wheel     10,000 timers   3,815 ns/timer  late by    25.2 ms (mean)    47.7 ms (p99)    149 B/timer
+# heap     100,000 timers   4,606 ns/timer  late by   222.2 ms (mean)   457.3 ms (p99)    279 B/timer
+# wheel    100,000 timers   3,173 ns/timer  late by   169.0 ms (mean)   322.7 ms (p99)    162 B/timer
+# heap   1,000,000 timers   4,893 ns/timer  late by 11777.4 ms (mean) 14654.8 ms (p99)    280 B/timer
+# wheel  1,000,000 timers   3,744 ns/timer  late by  3465.8 ms (mean)  4675.9 ms (p99)    183 B/timer
+#
+# Note:
+# With 100k timers or more, firing all the callbacks takes longer than the 1
+# second they are spread over, so the timers fall behind with both, but much
+# less with the wheel, as the loop pops every expired timer off its heap in
+# O(log n) and keeps each as a TimerHandle (of about twice the size of a
+# WheelTimer).
@@ -0,0 +1,268 @@
+#!usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Demo for an asyncio worker pool that scales the number of worker tasks with
+the load, instead of a fixed number of workers like in comm_via_queue.py.
+
+A supervisor task regularly estimates the number of workers needed to keep up
+with the arrival rate of the items, plus to drain the queued items within the
+target drain time (from the average time taken to handle an item), and starts
+more workers if needed.
+Once fewer workers than running have been needed for a few checks in a row, it
+retires the surplus: each worker checks after every item whether it should
+leave the pool.
+A worker also stops by itself once it has been idle for a while, as long as the
+pool keeps its minimum number of workers.
+Closing the pool waits for the queued items to be handled, and then lets each
+worker finish its current item, rather than cancelling it midway.
+"""
+
+import asyncio
+import math
+import time
+from asyncio import Queue
+from typing import Awaitable, Callable, Optional
+
+STOP = object()  # Marker telling a worker to stop
+SHRINK_AFTER = 4  # Checks in a row with surplus workers before retiring them
+
+
+class WorkerPool:
+    """
+    Pool of worker tasks handling the items of a queue.
+    """
+
+    def __init__(
+        self, handler: Callable[..., Awaitable], min_workers: int = 1,
+        max_workers: int = 16, target_drain_time: float = 0.5,
+        idle_timeout: float = 0.5, scale_interval: float = 0.05,
+        q: Optional[Queue] = None,
+        on_error: Optional[Callable[[object, Exception], None]] = None
+    ):
+        """
+        An exception raised by the handler is passed to the given error
+        callback with the item, or else reported (with its traceback) to the
+        exception handler of the event loop, which logs it by default.
+        :param handler: async function handling an item
+        :param min_workers: int
+        :param max_workers: int
+        :param target_drain_time: float (in seconds)
+        :param idle_timeout: float (in seconds)
+        :param scale_interval: float (in seconds)
+        :param q: Queue
+        :param on_error: callable
+        """
+        if not 1 <= min_workers <= max_workers:
+            raise ValueError('Expected 1 <= min_workers <= max_workers')
+        self._handler = handler
+        self._min_workers = min_workers
+        self._max_workers = max_workers
+        self._target_drain_time = target_drain_time
+        self._idle_timeout = idle_timeout
+        self._scale_interval = scale_interval
+        self._on_error = on_error
+        self.q = Queue() if q is None else q
+        self._workers = set()
+        self._supervisor = None
+        self._closing = False
+        self._next_id = 0
+        self._to_retire = 0  # Number of workers which should leave the pool
+        # Exponential moving average of the time taken to handle an item
+        self._avg_latency = 0.0
+        self._arrivals = 0  # Since the last check of the supervisor
+        self.handled = 0
+        self.failed = 0
+        self.peak_workers = 0
+
+    @property
+    def n_workers(self) -> int:
+        return len(self._workers)
+
+    async def start(self) -> None:
+        for _ in range(self._min_workers):
+            self._start_worker()
+        self._supervisor = asyncio.create_task(self._supervise())
+
+    async def put(self, item) -> None:
+        if self._closing:
+            raise RuntimeError('The pool is closing')
+        await self.q.put(item)
+        self._arrivals += 1
+
+    async def close(self) -> None:
+        """
+        Waits for all the queued items to be handled, and stops the workers.
+        Does nothing if the pool was not started.
+        :return: None
+        """
+        if self._supervisor is None:
+            return
+        self._closing = True
+        await self.q.join()
+        self._supervisor.cancel()
+        await asyncio.gather(self._supervisor, return_exceptions=True)
+        workers = list(self._workers)
+        for _ in workers:
+            self.q.put_nowait(STOP)
+        await asyncio.gather(*workers)
+
+    async def __aenter__(self) -> 'WorkerPool':
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    def _start_worker(self) -> None:
+        name = f'Worker-{self._next_id}'
+        self._next_id += 1
+        task = asyncio.create_task(self._worker(), name=name)
+        self._workers.add(task)
+        task.add_done_callback(self._workers.discard)
+        self.peak_workers = max(self.peak_workers, len(self._workers))
+
+    async def _worker(self) -> None:
+        """
+        Worker coroutine, which handles items until it is told to stop, or
+        until it has been idle for too long (unless the pool would have too few
+        workers then).
+        :return: None
+        """
+        while True:
+            try:
+                item = await asyncio.wait_for(
+                    self.q.get(), timeout=self._idle_timeout
+                )
+            except asyncio.TimeoutError:
+                if len(self._workers) > self._min_workers:
+                    self._to_retire = max(0, self._to_retire - 1)
+                    self._leave()
+                    return
+                continue
+            if item is STOP:
+                self.q.task_done()
+                return
+            started_at = time.monotonic()
+            try:
+                await self._handler(item)
+            except Exception as e:
+                # A failing item should not take the worker down with it
+                self.failed += 1
+                self._report_error(item, e)
+            else:
+                self.handled += 1
+            finally:
+                latency = time.monotonic() - started_at
+                self._avg_latency = latency if not self._avg_latency \
+                    else 0.8 * self._avg_latency + 0.2 * latency
+                self.q.task_done()
+            if self._to_retire and len(self._workers) > self._min_workers:
+                self._to_retire -= 1
+                self._leave()
+                return
+
+    def _leave(self) -> None:
+        # Leave the pool right away, so that the other workers and the
+        # supervisor see it
+        self._workers.discard(asyncio.current_task())
+
+    def _report_error(self, item, e: Exception) -> None:
+        if self._on_error is None:
+            asyncio.get_running_loop().call_exception_handler({
+                'message': f'Exception in the handler of {item!r}',
+                'exception': e,
+                'task': asyncio.current_task(),
+            })
+            return
+        try:
+            self._on_error(item, e)
+        except Exception as callback_error:
+            asyncio.get_running_loop().call_exception_handler({
+                'message': 'Exception in the error callback of the pool',
+                'exception': callback_error,
+            })
+
+    async def _supervise(self) -> None:
+        """
+        Supervisor coroutine, which starts more workers when they cannot keep
+        up with the load, and retires the surplus ones once the load has been
+        lower for a few checks in a row.
+        :return: None
+        """
+        arrival_rate = 0.0
+        surplus_checks = 0
+        while True:
+            await asyncio.sleep(self._scale_interval)
+            arrival_rate = 0.5 * arrival_rate + \
+                0.5 * self._arrivals / self._scale_interval
+            self._arrivals = 0
+            if not self._avg_latency:
+                continue
+            # Number of workers needed to keep up with the arrivals, and to
+            # drain the queue in the target time
+            needed = math.ceil(
+                arrival_rate * self._avg_latency +
+                self.q.qsize() * self._avg_latency / self._target_drain_time
+            )
+            needed = max(self._min_workers, min(needed, self._max_workers))
+            n_workers = len(self._workers)
+            if needed >= n_workers:
+                surplus_checks = 0
+                self._to_retire = 0
+                for _ in range(needed - n_workers):
+                    self._start_worker()
+                continue
+            surplus_checks += 1
+            if surplus_checks >= SHRINK_AFTER:
+                self._to_retire = n_workers - needed
+
+
+async def handle(sleep_for: float) -> None:
+    await asyncio.sleep(sleep_for)
+
+
+async def main():
+    pool = WorkerPool(handle, min_workers=1, max_workers=16)
+    await pool.start()
+    started_at = time.monotonic()
+
+    async def report() -> None:
+        while True:
+            await asyncio.sleep(0.5)
+            print(
+                f'{time.monotonic() - started_at:4.1f}s: '
+                f'{pool.n_workers:>2} workers, {pool.q.qsize():>3} queued'
+            )
+
+    reporter = asyncio.create_task(report())
+    # The load goes from 10 to 100 items/sec and back, every item taking 0.1s
+    for rate, duration in [(10, 1.0), (100, 1.5), (10, 1.5)]:
+        for _ in range(int(rate * duration)):
+            await pool.put(0.1)
+            await asyncio.sleep(1 / rate)
+    await pool.close()
+    reporter.cancel()
+    print('==========')
+    print(
+        f'Handled {pool.handled} items in '
+        f'{time.monotonic() - started_at:.2f} seconds, with at most '
+        f'{pool.peak_workers} workers'
+    )
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
+
+
+# Output:
+#  0.5s:  2 workers,   0 queued
+#  1.0s:  2 workers,   0 queued
+#  1.5s: 11 workers,   1 queued
+#  2.0s: 11 workers,   0 queued
+#  2.5s: 11 workers,   0 queued
+#  3.0s:  9 workers,   0 queued
+#  3.5s:  2 workers,   0 queued
+#  4.0s:  2 workers,   0 queued
+# ==========
+# Handled 175 items in 4.03 seconds, with at most 11 workers